@@ -0,0 +1,57 @@
+"""
+Shared code-hash cache helpers for check_code_cache.py and init_code_cache.py.
+
+Thin wrappers over src/code_reviewer.py, which owns the tracked file list,
+the hash algorithm and the data/code_hashes.json format, so the scripts and
+the bot always read and write the cache the same way.
+"""
+
+import sys
+from pathlib import Path
+from typing import Dict, Optional
+
+# code_reviewer lives in src/
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve() / "src"))
+
+from code_reviewer import (
+    HASH_ALGO,
+    TRACKED_FILES,
+    XXHASH_AVAILABLE,
+    _map_tracked_files,
+    calculate_file_hash_cached,
+    get_entry_hash,
+    get_hash_algo,
+    load_stored_hashes,
+    save_hashes,
+)
+
+
+def load_cache(data_dir: Path) -> dict:
+    """Load stored cache entries; empty dict if missing or unreadable."""
+    return load_stored_hashes(data_dir)
+
+
+def save_cache(data_dir: Path, entries: dict) -> None:
+    """Save cache entries."""
+    save_hashes(data_dir, entries)
+
+
+def hash_all_parallel(project_root: Path, stored: dict, match_stored_algo: bool = False) -> Dict[str, Optional[dict]]:
+    """
+    Hash all tracked files concurrently.
+    Returns {rel_path: entry or None if the file is missing}, in TRACKED_FILES order.
+    With match_stored_algo, each file is hashed with the algorithm of its stored
+    entry, so an algorithm switch alone doesn't look like a change.
+    """
+    def hash_one(rel_path: str) -> Optional[dict]:
+        cached_entry = stored.get(rel_path)
+        algo = HASH_ALGO
+        if match_stored_algo:
+            stored_hash = get_entry_hash(cached_entry)
+            if stored_hash:
+                algo = get_hash_algo(stored_hash)
+            if algo == "xxh3_128" and not XXHASH_AVAILABLE:
+                algo = HASH_ALGO
+        return calculate_file_hash_cached(Path(project_root) / rel_path, cached_entry, algo)
+
+    return dict(zip(TRACKED_FILES, _map_tracked_files(hash_one)))
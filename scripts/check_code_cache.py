@@ -10,32 +10,13 @@ Usage:
 """
 
 import sys
-import json
-import hashlib
 from pathlib import Path
 
 # Setup paths - works from any directory
 script_dir = Path(__file__).parent.resolve()
 project_root = script_dir.parent.resolve()
 
-# Files to track (same as in code_reviewer.py)
-TRACKED_FILES = [
-    "src/telegram_bot.py",
-    "src/writer_bot.py", 
-    "src/i18n.py",
-    "src/writer_rag.py",
-    "src/lang_utils.py",
-    "src/word_stats.py",
-]
-
-
-def calculate_file_hash(file_path: Path) -> str:
-    """Calculate SHA256 hash of file contents."""
-    try:
-        with open(file_path, 'rb') as f:
-            return hashlib.sha256(f.read()).hexdigest()[:16]
-    except Exception:
-        return ""
+from _code_cache_common import TRACKED_FILES, get_entry_hash, hash_all_parallel, load_cache
 
 
 def check_cache():
@@ -65,8 +46,7 @@ def check_cache():
         return 1
     
     # Load stored hashes
-    with open(hash_file, 'r', encoding='utf-8') as f:
-        stored_hashes = json.load(f)
+    stored_hashes = load_cache(data_dir)
     
     print(f"\nФайл кэша: {hash_file}")
     print(f"   Отслеживаемые файлы: {len(TRACKED_FILES)}")
@@ -79,11 +59,14 @@ def check_cache():
     print("СТАТУС ФАЙЛОВ:")
     print("-" * 60)
     
+    # Hash with the algorithm each cache entry was made with, to compare like with like
+    current_entries = hash_all_parallel(project_root, stored_hashes, match_stored_algo=True)
+    current_hashes = {rel: (entry["hash"] if entry else "N/A") for rel, entry in current_entries.items()}
+    
     changes_detected = False
     for rel_path in TRACKED_FILES:
-        file_path = project_root / rel_path
-        current_hash = calculate_file_hash(file_path) if file_path.exists() else "N/A"
-        stored_hash = stored_hashes.get(rel_path, "НЕТ В КЭШЕ")
+        current_hash = current_hashes[rel_path]
+        stored_hash = get_entry_hash(stored_hashes.get(rel_path)) or "НЕТ В КЭШЕ"
         
         if current_hash == stored_hash:
             status = "OK"
@@ -6,7 +6,9 @@ Usage: python scripts/chunk_books.py --input books/craft/ --output data/chunks_c
 
 import argparse
 import json
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Optional
 
@@ -17,6 +19,12 @@ except ImportError:
     TIKTOKEN_AVAILABLE = False
     print("Warning: tiktoken not installed. Using word-based chunking.")
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 try:
     import pypdf
     PYPDF_AVAILABLE = True
@@ -29,6 +37,22 @@ try:
 except ImportError:
     PDFPLUMBER_AVAILABLE = False
 
+# Write buffer for large JSON outputs (fewer write() syscalls than the 8 KiB default)
+WRITE_BUFFER_SIZE = 1 << 18
+
+# Chapter headings sit at the start of a chunk; only that window is searched
+_RE_CHAPTER = re.compile(r'Chapter\s+(\d+|[IVX]+)[:\s]*([^\n]+)?', re.IGNORECASE)
+CHAPTER_SEARCH_WINDOW = 256
+
+_ENC = None
+
+
+def _get_enc():
+    """Return the shared cl100k_base encoder (built once; construction loads BPE tables)."""
+    global _ENC
+    if _ENC is None:
+        _ENC = tiktoken.get_encoding("cl100k_base")
+    return _ENC
 
 
 def extract_text_from_pdf(path: Path) -> str:
@@ -36,33 +60,35 @@ def extract_text_from_pdf(path: Path) -> str:
     if not PYPDF_AVAILABLE:
         raise RuntimeError("pypdf not installed. pip install pypdf")
     
-    text = ""
+    parts = []
     
     # Open in binary mode - this is crucial for some PDFs
     with open(path, 'rb') as f:
         reader = pypdf.PdfReader(f)
         for page in reader.pages:
-            page_text = page.extract_text() or ""
-            text += page_text + "\n"
+            parts.append(page.extract_text() or "")
     
-    return text
+    # Every page is followed by a newline
+    return "\n".join(parts) + "\n" if parts else ""
+
 
 
 
+def chunk_by_token_ids(tokens: list[int], max_tokens: int = 500, overlap: int = 100) -> list[str]:
+    """Split already-encoded text into chunks by token count."""
+    token_slices = []
+    i = 0
+    while i < len(tokens):
+        token_slices.append(tokens[i:i + max_tokens])
+        i += max_tokens - overlap
+    # One batched decode instead of a decode call per chunk
+    return _get_enc().decode_batch(token_slices)
+
 
 def chunk_by_tokens(text: str, max_tokens: int = 500, overlap: int = 100) -> list[str]:
     """Split text into chunks by token count."""
     if TIKTOKEN_AVAILABLE:
-        enc = tiktoken.get_encoding("cl100k_base")
-        tokens = enc.encode(text)
-        chunks = []
-        i = 0
-        while i < len(tokens):
-            chunk_tokens = tokens[i:i + max_tokens]
-            chunk = enc.decode(chunk_tokens)
-            chunks.append(chunk)
-            i += max_tokens - overlap
-        return chunks
+        return chunk_by_token_ids(_get_enc().encode_ordinary(text), max_tokens, overlap)
     else:
         # Fallback: word-based chunking
         words = text.split()
@@ -75,22 +101,26 @@ def chunk_by_tokens(text: str, max_tokens: int = 500, overlap: int = 100) -> lis
         return chunks
 
 
-def chunk_by_paragraphs(text: str, max_tokens: int = 500) -> list[str]:
+def split_paragraphs(text: str) -> list[str]:
+    """Split text on blank lines, dropping empty paragraphs."""
+    return [p.strip() for p in re.split(r'\n\s*\n', text) if p.strip()]
+
+
+def chunk_by_paragraphs(text: str, max_tokens: int = 500, paragraphs: Optional[list[str]] = None) -> list[str]:
     """Split text into chunks by paragraphs, respecting token limit."""
-    paragraphs = [p.strip() for p in re.split(r'\n\s*\n', text) if p.strip()]
+    if paragraphs is None:
+        paragraphs = split_paragraphs(text)
     chunks = []
     current_chunk = []
     current_tokens = 0
     
     if TIKTOKEN_AVAILABLE:
-        enc = tiktoken.get_encoding("cl100k_base")
-        get_length = lambda x: len(enc.encode(x))
+        # One batched call instead of an encode() per paragraph
+        lengths = [len(ids) for ids in _get_enc().encode_ordinary_batch(paragraphs)]
     else:
-        get_length = lambda x: len(x.split())
+        lengths = [len(p.split()) for p in paragraphs]
     
-    for para in paragraphs:
-        para_tokens = get_length(para)
-        
+    for para, para_tokens in zip(paragraphs, lengths):
         if current_tokens + para_tokens > max_tokens and current_chunk:
             chunks.append("\n\n".join(current_chunk))
             current_chunk = [para]
@@ -149,7 +179,10 @@ def process_book(
     
     # Chunk: try paragraphs first, fallback to tokens if too few chunks
     if by_paragraphs:
-        chunks = chunk_by_paragraphs(text, max_tokens)
+        paragraphs = split_paragraphs(text)
+        # Paragraph chunking can't yield more chunks than paragraphs, so skip it
+        # (and its tokenization pass) when the outcome is already known
+        chunks = chunk_by_paragraphs(text, max_tokens, paragraphs) if len(paragraphs) >= 5 else []
         # If too few chunks (paragraph breaks are rare in this PDF), use token chunking
         if len(chunks) < 5:
             chunks = chunk_by_tokens(text, max_tokens, overlap)
@@ -157,14 +190,17 @@ def process_book(
         chunks = chunk_by_tokens(text, max_tokens, overlap)
 
     
-    # Build output
+    # Build output (per-book values resolved once, outside the per-chunk loop)
     results = []
     base_id = file_path.stem.replace(' ', '_').lower()
+    author = author or "Unknown"
+    book_title = book_title or file_path.stem
+    total_chunks = len(chunks)
     
     for i, chunk_text in enumerate(chunks):
         # Detect chapter if possible
         chapter = None
-        chapter_match = re.search(r'Chapter\s+(\d+|[IVX]+)[:\s]*([^\n]+)?', chunk_text, re.IGNORECASE)
+        chapter_match = _RE_CHAPTER.search(chunk_text, 0, CHAPTER_SEARCH_WINDOW)
         if chapter_match:
             chapter = chapter_match.group(0).strip()[:100]
         
@@ -172,11 +208,11 @@ def process_book(
             "id": f"{base_id}_{i+1}",
             "text": chunk_text,
             "category": category,
-            "author": author or "Unknown",
-            "book_title": book_title or file_path.stem,
+            "author": author,
+            "book_title": book_title,
             "chapter": chapter or "",
             "chunk_index": i + 1,
-            "total_chunks": len(chunks),
+            "total_chunks": total_chunks,
         }
         results.append(chunk_data)
     
@@ -194,6 +230,7 @@ def main():
     parser.add_argument("--overlap", type=int, default=100, help="Token overlap between chunks")
     parser.add_argument("--by-paragraphs", action="store_true", default=True, help="Chunk by paragraphs")
     parser.add_argument("--by-tokens", action="store_true", help="Chunk by exact token count")
+    parser.add_argument("--workers", "-w", type=int, default=os.cpu_count() or 1, help="Parallel worker processes (books are processed independently)")
     
     args = parser.parse_args()
     
@@ -206,52 +243,60 @@ def main():
     else:
         # Debug: list all files in directory
         print(f"Looking in: {input_path.absolute()}")
-        all_files = list(input_path.iterdir())
-        print(f"All files in directory: {[f.name for f in all_files]}")
-        
-        # Case-insensitive glob for PDF and TXT
-        files = []
-        for pattern in ["*.pdf", "*.PDF", "*.Pdf", "*.txt", "*.TXT", "*.Txt"]:
-            matched = list(input_path.glob(pattern))
-            if matched:
-                print(f"  Pattern '{pattern}' matched: {[f.name for f in matched]}")
-            files.extend(matched)
-        # Remove duplicates while preserving order
-        seen = set()
-        unique_files = []
-        for f in files:
-            if f not in seen:
-                seen.add(f)
-                unique_files.append(f)
-        files = unique_files
+        # Single directory pass; case-insensitive suffix match for PDF and TXT
+        with os.scandir(input_path) as it:
+            entries = sorted((e for e in it if e.is_file()), key=lambda e: e.name)
+        print(f"All files in directory: {[e.name for e in entries]}")
+        files = [Path(e.path) for e in entries if e.name.lower().endswith(('.pdf', '.txt'))]
 
     
     print(f"Found {len(files)} files to process")
 
     
-    for file_path in files:
-        print(f"Processing: {file_path.name}")
-        try:
-            chunks = process_book(
-                file_path,
-                category=args.category,
-                author=args.author,
-                book_title=args.book,
-                max_tokens=args.max_tokens,
-                overlap=args.overlap,
-                by_paragraphs=not args.by_tokens,
-            )
-            all_chunks.extend(chunks)
-            print(f"  → {len(chunks)} chunks")
-        except Exception as e:
-            print(f"  ✗ Error: {e}")
+    book_kwargs = dict(
+        category=args.category,
+        author=args.author,
+        book_title=args.book,
+        max_tokens=args.max_tokens,
+        overlap=args.overlap,
+        by_paragraphs=not args.by_tokens,
+    )
+    workers = max(1, min(args.workers, len(files)))
+    
+    if workers == 1:
+        for file_path in files:
+            print(f"Processing: {file_path.name}")
+            try:
+                chunks = process_book(file_path, **book_kwargs)
+                all_chunks.extend(chunks)
+                print(f"  → {len(chunks)} chunks")
+            except Exception as e:
+                print(f"  ✗ Error: {e}")
+    else:
+        # Books are independent and PDF extraction is CPU-bound: spread them over processes.
+        # Results are collected in input order so the output file is deterministic.
+        print(f"Processing with {workers} worker processes")
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            futures = [ex.submit(process_book, file_path, **book_kwargs) for file_path in files]
+            for file_path, future in zip(files, futures):
+                print(f"Processing: {file_path.name}")
+                try:
+                    chunks = future.result()
+                    all_chunks.extend(chunks)
+                    print(f"  → {len(chunks)} chunks")
+                except Exception as e:
+                    print(f"  ✗ Error: {e}")
     
     # Save output
     output_path = Path(args.output)
     output_path.parent.mkdir(parents=True, exist_ok=True)
     
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(all_chunks, f, ensure_ascii=False, indent=2)
+    if ORJSON_AVAILABLE:
+        with open(output_path, "wb", buffering=WRITE_BUFFER_SIZE) as f:
+            f.write(orjson.dumps(all_chunks, option=orjson.OPT_INDENT_2))
+    else:
+        with open(output_path, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as f:
+            json.dump(all_chunks, f, ensure_ascii=False, indent=2)
     
     print(f"\nTotal: {len(all_chunks)} chunks saved to {output_path}")
 
@@ -1,15 +1,55 @@
+import functools
 import json
 import re
 import os
+import shutil
+import tempfile
 from pathlib import Path
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
+# Write buffer for large JSON outputs (fewer write() syscalls than the 8 KiB default)
+WRITE_BUFFER_SIZE = 1 << 18
+
+_RE_HYPHEN_BREAK = re.compile(r'(\w+)-\s*\n\s*(\w+)')
+# Only matches when the second char repeats the first (case-insensitive), so the
+# whole pass runs in the regex engine; group 2 keeps the second char's case.
+_RE_REPEATED = re.compile(r'(\w)\s*\n\s*((?i:\1))')
+_RE_MULTISPACE = re.compile(r'\s+')
+
+
+# Only short strings are memoized: repeated artifacts (headers, footers, stock
+# phrases) are short, and caching long paragraphs would just hold memory
+CLEAN_CACHE_MAX_LEN = 4096
+
+
 def clean_text(text):
     if not text:
         return text
-    
+    if isinstance(text, str) and len(text) <= CLEAN_CACHE_MAX_LEN:
+        return _clean_text_cached(text)
+    return _clean_text_impl(text)
+
+
+@functools.lru_cache(maxsize=8192)
+def _clean_text_cached(text):
+    return _clean_text_impl(text)
+
+
+def _clean_text_impl(text):
     # 1. Fix broken words with hyphens at line breaks (e.g. "доказател-\nьства" -> "доказательства")
     # This is common in PDF extraction
-    text = re.sub(r'(\w+)-\s*\n\s*(\w+)', r'\1\2', text)
+    text = _RE_HYPHEN_BREAK.sub(r'\1\2', text)
     
     # 2. Fix broken words without hyphens (e.g. "помнишь\nь", "с\nсмерти", "У\nУ меня")
     # This looks like a specific artifact where the last letter is repeated or split
@@ -19,62 +59,118 @@ def clean_text(text):
     
     # Case A: Single letter repeated after newline (e.g. "с\nсмерти")
     # We look for: char + newline + same char
-    def fix_repeated_char(match):
-        char1 = match.group(1)
-        char2 = match.group(2)
-        if char1.lower() == char2.lower():
-            return char2
-        return match.group(0)
-    
-    text = re.sub(r'(\w)\s*\n\s*(\w)', fix_repeated_char, text)
-
-    # 3. Fix random newlines in the middle of sentences
-    # Replace newline with space if it's not followed by an uppercase letter (start of new sentence)
-    # and not preceded by punctuation (end of sentence)
-    # This is a heuristic and might be too aggressive for poetry, but good for prose.
-    # We'll be conservative: only replace newline with space if surrounded by lowercase letters or comma
-    text = re.sub(r'(?<=[а-яa-z,])\s*\n\s*(?=[а-яa-z])', ' ', text)
-    
-    # 4. Collapse multiple spaces
-    text = re.sub(r'\s+', ' ', text)
+    text = _RE_REPEATED.sub(r'\2', text)
+
+    # 3. Collapse whitespace, including the remaining line breaks, to single spaces.
+    # (A separate "newline between lowercase letters -> space" pass used to run
+    # here; its output was always subsumed by this collapse, so it was dropped.)
+    text = _RE_MULTISPACE.sub(' ', text)
     
     return text.strip()
 
+def load_json(filepath):
+    if ORJSON_AVAILABLE:
+        with open(filepath, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def dump_json_bytes(data) -> bytes:
+    """Serialize like json.dump(..., ensure_ascii=False, indent=2), as UTF-8 bytes."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def is_json_list(filepath) -> bool:
+    """Check whether the top-level JSON value is a list, without parsing the file."""
+    with open(filepath, 'rb') as f:
+        while True:
+            ch = f.read(1)
+            if not ch or not ch.isspace():
+                return ch == b'['
+
+
+def iter_list_items(filepath):
+    """Yield items of a top-level JSON list, streamed with ijson when available."""
+    if IJSON_AVAILABLE:
+        with open(filepath, 'rb') as f:
+            yield from ijson.items(f, 'item', use_float=True)
+    else:
+        yield from load_json(filepath)
+
+
+def clean_list_file(filepath, out) -> bool:
+    """
+    Stream cleaned items of a top-level list into `out`, one at a time.
+    Framing reproduces json.dump(indent=2) exactly. Returns True if any item changed.
+    """
+    modified = False
+    first = True
+    for item in iter_list_items(filepath):
+        if isinstance(item, dict) and 'text' in item:
+            original = item['text']
+            cleaned = clean_text(original)
+            if original != cleaned:
+                item['text'] = cleaned
+                modified = True
+        out.write(b'[\n  ' if first else b',\n  ')
+        # JSON strings never contain raw newlines, so this only re-indents structure
+        out.write(dump_json_bytes(item).replace(b'\n', b'\n  '))
+        first = False
+    out.write(b'[]' if first else b'\n]')
+    return modified
+
+
+def clean_dict_file(filepath, out) -> bool:
+    """Clean a {"key": [...]} file in memory and write it to `out`. Returns True if changed."""
+    data = load_json(filepath)
+    modified = False
+    if isinstance(data, dict):
+        # Handle structure like {"prompts": [...]}
+        for key, value in data.items():
+            if isinstance(value, list):
+                for i, item in enumerate(value):
+                    if isinstance(item, str):
+                        cleaned = clean_text(item)
+                        if item != cleaned:
+                            value[i] = cleaned
+                            modified = True
+                    elif isinstance(item, dict) and 'text' in item:
+                        original = item['text']
+                        cleaned = clean_text(original)
+                        if original != cleaned:
+                            item['text'] = cleaned
+                            modified = True
+    if modified:
+        out.write(dump_json_bytes(data))
+    return modified
+
+
 def process_file(filepath):
     print(f"Processing {filepath}...")
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        modified = False
-        if isinstance(data, list):
-            for item in data:
-                if 'text' in item:
-                    original = item['text']
-                    cleaned = clean_text(original)
-                    if original != cleaned:
-                        item['text'] = cleaned
-                        modified = True
-        elif isinstance(data, dict):
-            # Handle structure like {"prompts": [...]}
-            for key, value in data.items():
-                if isinstance(value, list):
-                    for i, item in enumerate(value):
-                        if isinstance(item, str):
-                            cleaned = clean_text(item)
-                            if item != cleaned:
-                                value[i] = cleaned
-                                modified = True
-                        elif isinstance(item, dict) and 'text' in item:
-                            original = item['text']
-                            cleaned = clean_text(original)
-                            if original != cleaned:
-                                item['text'] = cleaned
-                                modified = True
+        # Write to a temp file next to the original; it replaces the original
+        # only if something changed, otherwise it is discarded
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filepath) or '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb', buffering=WRITE_BUFFER_SIZE) as out:
+                if is_json_list(filepath):
+                    modified = clean_list_file(filepath, out)
+                else:
+                    modified = clean_dict_file(filepath, out)
+            if modified:
+                shutil.copymode(filepath, tmp_path)
+                os.replace(tmp_path, filepath)
+            else:
+                os.unlink(tmp_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
 
         if modified:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
             print(f"Fixed and saved {filepath}")
         else:
             print(f"No changes needed for {filepath}")
@@ -9,33 +9,17 @@ Usage:
     cd scripts && python3 init_code_cache.py
 """
 
+import os
 import sys
-import json
-import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Setup paths - works from any directory
 script_dir = Path(__file__).parent.resolve()
 project_root = script_dir.parent.resolve()
 
-# Files to track (same as in code_reviewer.py)
-TRACKED_FILES = [
-    "src/telegram_bot.py",
-    "src/writer_bot.py", 
-    "src/i18n.py",
-    "src/writer_rag.py",
-    "src/lang_utils.py",
-    "src/word_stats.py",
-]
-
-
-def calculate_file_hash(file_path: Path) -> str:
-    """Calculate SHA256 hash of file contents."""
-    try:
-        with open(file_path, 'rb') as f:
-            return hashlib.sha256(f.read()).hexdigest()[:16]
-    except Exception:
-        return ""
+from _code_cache_common import hash_all_parallel, load_cache, save_cache
 
 
 def get_backup_dir(data_dir: Path) -> Path:
@@ -43,14 +27,35 @@ def get_backup_dir(data_dir: Path) -> Path:
     return data_dir / "code_backup"
 
 
+def get_backup_file(data_dir: Path, rel_path: str) -> Path:
+    """Get backup file path for a tracked file."""
+    return get_backup_dir(data_dir) / rel_path.replace("/", "_")
+
+
+def is_backup_fresh(data_dir: Path, rel_path: str, entry: dict) -> bool:
+    """True if the backup has the source's size and is not older than it (per the hash entry's stat)."""
+    try:
+        dst = os.stat(get_backup_file(data_dir, rel_path))
+    except OSError:
+        return False
+    return entry["size"] == dst.st_size and entry["mtime_ns"] <= dst.st_mtime_ns
+
+
 def save_file_backup(data_dir: Path, rel_path: str, content: str) -> None:
-    """Save file content backup."""
+    """Save file content backup (atomically, via temp file + os.replace)."""
     backup_dir = get_backup_dir(data_dir)
-    backup_file = backup_dir / rel_path.replace("/", "_")
+    backup_file = get_backup_file(data_dir, rel_path)
     try:
         backup_dir.mkdir(parents=True, exist_ok=True)
-        with open(backup_file, 'w', encoding='utf-8') as f:
-            f.write(content)
+        fd, tmp_path = tempfile.mkstemp(dir=backup_dir, prefix=".tmp_")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, backup_file)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
     except Exception as e:
         print(f"   Warning: Failed to backup {rel_path}: {e}")
 
@@ -63,30 +68,42 @@ def init_cache():
     # Ensure data directory exists
     data_dir.mkdir(parents=True, exist_ok=True)
     
-    # Calculate hashes for all tracked files and save backups
+    # Load previous entries so unchanged files (same size + mtime) skip rehashing
+    stored_hashes = load_cache(data_dir)
+    
+    # Calculate hashes for all tracked files
+    entries = hash_all_parallel(project_root, stored_hashes)
+    
+    # Save file content backups for diff generation (skip those already up to date)
+    def backup_tracked_file(rel_path: str) -> None:
+        if is_backup_fresh(data_dir, rel_path, entries[rel_path]):
+            return
+        try:
+            with open(project_root / rel_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            save_file_backup(data_dir, rel_path, content)
+        except Exception as e:
+            print(f"   Warning: Could not backup {rel_path}: {e}")
+    
+    found = [rel_path for rel_path, entry in entries.items() if entry is not None]
+    if found:
+        with ThreadPoolExecutor(max_workers=min(8, len(found))) as ex:
+            list(ex.map(backup_tracked_file, found))
+    
     current_hashes = {}
-    for rel_path in TRACKED_FILES:
-        file_path = project_root / rel_path
-        if file_path.exists():
-            # Calculate hash
-            current_hash = calculate_file_hash(file_path)
-            current_hashes[rel_path] = current_hash
-            
-            # Save file content backup for diff generation
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                save_file_backup(data_dir, rel_path, content)
-            except Exception as e:
-                print(f"   Warning: Could not backup {rel_path}: {e}")
-            
-            print(f"✓ {rel_path}: {current_hash}")
+    for rel_path, entry in entries.items():
+        if entry is not None:
+            current_hashes[rel_path] = entry
+            print(f"✓ {rel_path}: {entry['hash']}")
         else:
             print(f"✗ {rel_path}: file not found")
     
-    # Save to cache
-    with open(hash_file, 'w', encoding='utf-8') as f:
-        json.dump(current_hashes, f, ensure_ascii=False, indent=2)
+    # Save to cache (only if something changed)
+    if current_hashes == stored_hashes:
+        print(f"\n✅ Cache already up to date: {hash_file}")
+        return 0
+    
+    save_cache(data_dir, current_hashes)
     
     print(f"\n✅ Cache initialized: {hash_file}")
     print(f"   Backups saved to: {get_backup_dir(data_dir)}")
@@ -36,22 +36,14 @@ from code_reviewer import (
     get_changed_files, 
     load_stored_hashes,
     save_hashes,
-    calculate_file_hash
+    get_current_hashes
 )
 
-# Tracked files list (must match code_reviewer.py)
-TRACKED_FILES = [
-    "src/telegram_bot.py",
-    "src/writer_bot.py", 
-    "src/i18n.py",
-    "src/writer_rag.py",
-    "src/lang_utils.py",
-    "src/word_stats.py",
-]
-
 
 def load_writer_bot():
-    """Load WriterBot class directly from file."""
+    """Load WriterBot class directly from file (reuses the module if already loaded)."""
+    if "writer_bot" in sys.modules:
+        return sys.modules["writer_bot"].WriterBot
     spec = importlib.util.spec_from_file_location("writer_bot", src_dir / "writer_bot.py")
     wb_module = importlib.util.module_from_spec(spec)
     sys.modules["writer_bot"] = wb_module
@@ -173,12 +165,7 @@ def test_changelog(lang="ru", save_hashes=False):
             
             if save_hashes:
                 print_section("Updating hash cache...")
-                current_hashes = {}
-                for rel_path in TRACKED_FILES:
-                    file_path = project_root / rel_path
-                    if file_path.exists():
-                        current_hashes[rel_path] = calculate_file_hash(file_path)
-                save_hashes(data_dir, current_hashes)
+                save_hashes(data_dir, get_current_hashes(project_root, stored_hashes))
                 print_success("Cache updated - next restart won't trigger notifications")
             else:
                 print_info("Run with --save-hashes to update cache")
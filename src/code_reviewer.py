@@ -8,10 +8,26 @@ import json
 import hashlib
 import re
 import random
+import difflib
+import itertools
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # Files to track for changes
 TRACKED_FILES = [
     "src/telegram_bot.py",
@@ -22,6 +38,11 @@ TRACKED_FILES = [
     "src/word_stats.py",
 ]
 
+# Hashes only detect local code changes, so a fast non-cryptographic hash is enough.
+# Set HASH_ALGO = "sha256" to go back to SHA256 (stored as bare hex, as before).
+HASH_ALGO = "xxh3_128" if XXHASH_AVAILABLE else "sha256"
+XXH3_PREFIX = "xxh3:"
+
 # Existing commands that should NOT be mentioned as new in changelogs
 EXISTING_COMMANDS = [
     "start", "help", "lang", "switchlang", "reset", "block", "develop",
@@ -33,6 +54,67 @@ EXISTING_COMMANDS = [
     "get_writing_prompt", "generate_idea", "develop_idea", "character_help",
     "dialogue_help", "methodique_random", "cry_baby_reply", "lobster_love"
 ]
+_EXISTING_COMMANDS_SET = frozenset(f"/{cmd}" for cmd in EXISTING_COMMANDS)
+
+
+# Command definitions, matched in one pass: Command("/name"),
+# @self.dp.message(Command("name")) and async def cmd_name(
+_COMMAND_RE = re.compile(
+    r'Command\(["\'](?P<slash>/\w+)["\']'
+    r'|@self\.dp\.message\(Command\(["\'](?P<plain>\w+)["\']'
+    r'|async def cmd_(?P<func>\w+)\('
+)
+
+
+# Diff size sent to the LLM per changed file
+MAX_DIFF_CHARS = 3000
+
+
+# Changelog prompts. The fixed text comes first so it stays byte-identical
+# between runs (cacheable as a prompt prefix); only the file diffs vary.
+# Known existing commands are listed to prevent hallucination.
+_PROMPT_PREFIX_RU = f"""Ты пишешь changelog для пользователей.
+
+СТРОГИЕ ПРАВИЛА:
+1) Пиши ТОЛЬКО о реальных изменениях в коде - что именно починили или улучшили
+2) Если изменений мало → напиши ОДНО предложение или пропусти
+3) НИКОГДА не придумывай новые команды или фичи которых нет в коде!
+4) Не вымучивай пункты - максимум 2-3 если есть реальные изменения
+5) Фокусируйся на: исправленных багах, починенных командах, улучшенной логике работы
+
+УЖЕ СУЩЕСТВУЮЩИЕ: {", ".join(EXISTING_COMMANDS[:12])}...
+
+"""
+_PROMPT_SUFFIX_RU = """
+
+Напиши changelog на русском. Будь конкретным - опиши что именно починили, но сохраняй лёгкий сарказм в духе "мы это сделали, и вроде работает"."""
+
+_PROMPT_PREFIX_EN = """You are a cynical PM with 20 years of experience writing release notes. Your style: sarcastic but informative. No fluff or technical jargon.
+
+ANALYZE THE CODE and identify what changed for USERS:
+- New commands (cmd_* functions) — what the command does in simple words
+- Improvements to existing commands — what got better
+- Fixed bugs — what was broken and now works
+- New features — how this helps the user
+
+RULES:
+1. Write ONLY about REAL changes in the code below
+2. DO NOT invent commands or features that don't exist
+3. Write in plain language, like for a friend, not a programmer
+4. Maximum 5 items, significant changes only
+5. Format: "- Brief name: what changed and why it matters to users"
+6. No repetitive "- What:" at the start, each item should be unique
+
+Changed files:
+"""
+_PROMPT_SUFFIX_EN = """
+
+Write changelog in English. Be specific but keep a light sarcastic tone like "we did this thing and it sort of works"."""
+
+
+# Changelog items to keep; the stream is cut off once the model starts another
+MAX_CHANGELOG_ITEMS = 5
+_CHANGELOG_ITEM_RE = re.compile(r'^[ \t]*(?:[-•]|\d+[.)])[ \t]', re.MULTILINE)
 
 
 # Witty comments for changelog
@@ -43,24 +125,74 @@ WITTY_COMMENTS = [
     "Код переписан. Старые костыли заменены на новые, более элегантные.",
     "Код обновлён. Если что-то сломалось — это специально.",
 ]
+# Shuffled once per process, then cycled
+_WITTY_ITER = itertools.cycle(random.sample(WITTY_COMMENTS, len(WITTY_COMMENTS)))
+
 
 
 
+def get_hash_algo(file_hash: str) -> str:
+    """Algorithm a stored hash was made with: "xxh3:"-prefixed or bare (legacy) SHA256."""
+    return "xxh3_128" if file_hash.startswith(XXH3_PREFIX) else "sha256"
 
-def calculate_file_hash(file_path: Path) -> str:
-    """Calculate SHA256 hash of file contents."""
+
+def calculate_file_hash(file_path: Path, algo: str = HASH_ALGO) -> str:
+    """Hash file contents for change detection (streamed, no full-file read)."""
     try:
-        with open(file_path, 'rb') as f:
-            return hashlib.sha256(f.read()).hexdigest()[:16]
+        with open(file_path, 'rb', buffering=0) as f:
+            if algo == "xxh3_128":
+                h = xxhash.xxh3_128()
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+                return XXH3_PREFIX + h.hexdigest()
+            if hasattr(hashlib, "file_digest"):  # Python 3.11+
+                return hashlib.file_digest(f, 'sha256').hexdigest()[:16]
+            h = hashlib.sha256()
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+            return h.hexdigest()[:16]
     except Exception:
         return ""
 
 
-def load_stored_hashes(data_dir: Path) -> Dict[str, str]:
-    """Load previously stored file hashes."""
+def get_entry_hash(entry) -> str:
+    """Return hash from a stored entry (bare string in the old schema, dict in the new one)."""
+    if isinstance(entry, dict):
+        return entry.get("hash", "")
+    return entry or ""
+
+
+def calculate_file_hash_cached(file_path: Path, cached_entry=None, algo: str = HASH_ALGO) -> Optional[dict]:
+    """
+    Return {"hash", "size", "mtime_ns"} for a file, or None if it doesn't exist.
+    Reuses the cached hash when it was made with `algo` and size and mtime are
+    unchanged, so a no-change restart costs one stat() per file instead of a read + hash.
+    Old-schema (bare string) entries have no stat info and are always rehashed.
+    """
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    if (isinstance(cached_entry, dict)
+            and cached_entry.get("hash")
+            and get_hash_algo(cached_entry["hash"]) == algo
+            and cached_entry.get("size") == st.st_size
+            and cached_entry.get("mtime_ns") == st.st_mtime_ns):
+        return cached_entry
+    return {
+        "hash": calculate_file_hash(file_path, algo),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+    }
+
+
+def load_stored_hashes(data_dir: Path) -> Dict[str, dict]:
+    """Load previously stored file entries ({"hash", "size", "mtime_ns"}, or a bare hash in old caches)."""
     hash_file = data_dir / "code_hashes.json"
     if hash_file.exists():
         try:
+            if ORJSON_AVAILABLE:
+                return orjson.loads(hash_file.read_bytes())
             with open(hash_file, 'r', encoding='utf-8') as f:
                 return json.load(f)
         except Exception:
@@ -68,50 +200,97 @@ def load_stored_hashes(data_dir: Path) -> Dict[str, str]:
     return {}
 
 
-def save_hashes(data_dir: Path, hashes: Dict[str, str]) -> None:
-    """Save current file hashes."""
+def save_hashes(data_dir: Path, hashes: Dict[str, dict]) -> None:
+    """Save current file entries (atomically, via temp file + os.replace)."""
     hash_file = data_dir / "code_hashes.json"
+    tmp_file = hash_file.with_suffix(".json.tmp")
     try:
         data_dir.mkdir(parents=True, exist_ok=True)
-        with open(hash_file, 'w', encoding='utf-8') as f:
-            json.dump(hashes, f, ensure_ascii=False, indent=2)
+        if ORJSON_AVAILABLE:
+            tmp_file.write_bytes(orjson.dumps(hashes, option=orjson.OPT_INDENT_2))
+        else:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(hashes, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, hash_file)
     except Exception as e:
         print(f"Failed to save hashes: {e}")
 
 
-def get_changed_files(project_root: Path, stored_hashes: Dict[str, str]) -> List[Tuple[str, str, str]]:
+def _map_tracked_files(func) -> list:
+    """Run func(rel_path) for every tracked file concurrently (hashing releases the GIL)."""
+    with ThreadPoolExecutor(max_workers=min(8, len(TRACKED_FILES))) as ex:
+        return list(ex.map(func, TRACKED_FILES))
+
+
+def get_current_hashes(project_root: Path, stored_hashes: Dict[str, dict]) -> Dict[str, dict]:
+    """Build entries for all existing tracked files, reusing unchanged stored ones."""
+    entries = _map_tracked_files(
+        lambda rel_path: calculate_file_hash_cached(project_root / rel_path, stored_hashes.get(rel_path))
+    )
+    return {
+        rel_path: entry
+        for rel_path, entry in zip(TRACKED_FILES, entries)
+        if entry is not None
+    }
+
+
+def get_changed_files(project_root: Path, stored_hashes: Dict[str, dict]) -> List[Tuple[str, str, str]]:
     """
     Compare current files with stored hashes.
     Returns list of (filename, old_hash, new_hash) for changed files.
     """
-    changed = []
-    for rel_path in TRACKED_FILES:
+    def check_file(rel_path: str) -> Optional[Tuple[str, str, str]]:
         file_path = project_root / rel_path
-        if file_path.exists():
-            current_hash = calculate_file_hash(file_path)
-            old_hash = stored_hashes.get(rel_path, "")
-            if current_hash != old_hash:
-                changed.append((rel_path, old_hash, current_hash))
-    return changed
+        cached_entry = stored_hashes.get(rel_path)
+        old_hash = get_entry_hash(cached_entry)
+        # Hash with the algorithm the stored hash was made with: compare like with
+        # like, so switching algorithms alone doesn't look like a code change
+        algo = get_hash_algo(old_hash) if old_hash else HASH_ALGO
+        if algo == "xxh3_128" and not XXHASH_AVAILABLE:
+            algo = HASH_ALGO
+        entry = calculate_file_hash_cached(file_path, cached_entry, algo)
+        if entry is None or entry["hash"] == old_hash:
+            return None
+        new_hash = entry["hash"] if algo == HASH_ALGO else calculate_file_hash(file_path)
+        return (rel_path, old_hash, new_hash)
+    
+    return [change for change in _map_tracked_files(check_file) if change is not None]
 
 
 def extract_commands_from_code(content: str) -> List[str]:
     """Extract command names from code content."""
     commands = []
-    patterns = [
-        r'Command\(["\'](/\w+)["\']',
-        r'@self\.dp\.message\(Command\(["\'](\w+)["\']',
-        r'async def cmd_(\w+)\(',
-    ]
-    for pattern in patterns:
-        matches = re.findall(pattern, content)
-        for match in matches:
-            cmd = match if match.startswith('/') else f"/{match}"
-            if cmd not in commands:
-                commands.append(cmd)
+    seen = set()
+    for match in _COMMAND_RE.finditer(content):
+        name = match.group("slash") or match.group("plain") or match.group("func")
+        cmd = name if name.startswith('/') else f"/{name}"
+        if cmd not in seen:
+            seen.add(cmd)
+            commands.append(cmd)
     return commands
 
 
+# Changed files' text, keyed by content hash, so the changelog and the
+# command analysis read each file from disk only once
+_content_cache: Dict[str, str] = {}
+
+
+def read_tracked_file(project_root: Path, rel_path: str, file_hash: str = "") -> str:
+    """Read a tracked file's text, cached by its content hash when one is given."""
+    if file_hash and file_hash in _content_cache:
+        return _content_cache[file_hash]
+    content = (project_root / rel_path).read_text(encoding='utf-8')
+    if file_hash:
+        _content_cache[file_hash] = content
+    return content
+
+
+@lru_cache(maxsize=64)
+def _extract_commands_cached(file_hash: str) -> Tuple[str, ...]:
+    """extract_commands_from_code for content already in _content_cache (keyed by hash, not text)."""
+    return tuple(extract_commands_from_code(_content_cache[file_hash]))
+
+
 def analyze_code_changes(project_root: Path, changed_files: List[Tuple[str, str, str]]) -> Dict[str, List[str]]:
     """Analyze what actually changed in the code."""
     result = {
@@ -121,97 +300,131 @@ def analyze_code_changes(project_root: Path, changed_files: List[Tuple[str, str,
         "changed_files_count": len(changed_files)
     }
     
+    # Ordered dedupe (dict keys), so the command order is stable between runs
+    seen_commands: Dict[str, None] = {}
     for rel_path, old_hash, new_hash in changed_files:
-        file_path = project_root / rel_path
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            commands = extract_commands_from_code(content)
-            if commands:
-                result["all_commands"].extend(commands)
+            content = read_tracked_file(project_root, rel_path, new_hash)
+            commands = _extract_commands_cached(new_hash) if new_hash else extract_commands_from_code(content)
+            seen_commands.update(dict.fromkeys(commands))
             
             result["has_changes"] = True
         except Exception:
             result["has_changes"] = True
     
-    # Remove duplicates
-    result["all_commands"] = list(set(result["all_commands"]))
+    result["all_commands"] = list(seen_commands)
+    result["new_commands"] = [cmd for cmd in result["all_commands"] if cmd not in _EXISTING_COMMANDS_SET]
     return result
 
 
+def get_backup_file(data_dir: Path, rel_path: str) -> Path:
+    """Previous version of a tracked file (same layout as scripts/init_code_cache.py)."""
+    return data_dir / "code_backup" / rel_path.replace("/", "_")
+
+
+def load_file_backup(data_dir: Path, rel_path: str) -> Optional[str]:
+    """Load the previous version of a tracked file, if there is one."""
+    try:
+        return get_backup_file(data_dir, rel_path).read_text(encoding='utf-8')
+    except OSError:
+        return None
+
+
+def save_file_backups(project_root: Path, data_dir: Path, changed_files: List[Tuple[str, str, str]]) -> None:
+    """Store the current version of changed files as the base for the next diff."""
+    for rel_path, old_hash, new_hash in changed_files:
+        try:
+            content = read_tracked_file(project_root, rel_path, new_hash)
+            backup_file = get_backup_file(data_dir, rel_path)
+            backup_file.parent.mkdir(parents=True, exist_ok=True)
+            backup_file.write_text(content, encoding='utf-8')
+        except Exception as e:
+            print(f"Failed to backup {rel_path}: {e}")
+
+
+def build_file_diff(rel_path: str, old_content: str, new_content: str) -> str:
+    """Unified diff of a tracked file against its previous version."""
+    return "".join(difflib.unified_diff(
+        old_content.splitlines(keepends=True),
+        new_content.splitlines(keepends=True),
+        fromfile=f"a/{rel_path}",
+        tofile=f"b/{rel_path}",
+        n=2,
+    ))
+
+
 def get_witty_comment(num_changes: int, lang: str = "ru") -> str:
     """Get a witty comment."""
-    return random.choice(WITTY_COMMENTS)
+    return next(_WITTY_ITER)
+
 
 
 
+def read_changelog_stream(stream, max_items: int = MAX_CHANGELOG_ITEMS) -> str:
+    """Collect a streamed completion, stopping as soon as it starts item max_items + 1."""
+    parts = []
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            parts.append(delta)
+            if "\n" not in delta:
+                continue
+            text = "".join(parts)
+            items = list(_CHANGELOG_ITEM_RE.finditer(text))
+            if len(items) > max_items:
+                return text[:items[max_items].start()]
+    finally:
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+    return "".join(parts)
+
 
 def generate_changelog_with_llm(writer_bot, changed_files: List[Tuple[str, str, str]], project_root: Path, lang: str = "ru") -> str:
     """
     Use LLM to generate a human-readable changelog based on file changes.
+    All changed files go into a single request; don't call this per file.
     """
     if not changed_files:
         return ""
     
     num_changes = len(changed_files)
     
-    # Generate content for each changed file
+    # Generate a diff (or, without a previous version, the content) for each changed file
+    data_dir = project_root / "data"
     diff_sections = []
     for rel_path, old_hash, new_hash in changed_files:
-        file_path = project_root / rel_path
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            diff_sections.append(f"File: {rel_path}\n{content[:5000]}")
+            content = read_tracked_file(project_root, rel_path, new_hash)
+            old_content = load_file_backup(data_dir, rel_path)
+            if old_content is None:
+                diff_sections.append(f"File: {rel_path}\n{content[:5000]}")
+                continue
+            if old_content.split() == content.split():
+                continue  # Whitespace-only change
+            diff = build_file_diff(rel_path, old_content, content)
+            diff_sections.append(f"File: {rel_path} (diff)\n{diff[:MAX_DIFF_CHARS]}")
         except Exception as e:
             diff_sections.append(f"File: {rel_path}\n[Error: {e}]")
     
-    diff_content = "\n\n".join(diff_sections)
+    if not diff_sections:
+        return ""
     
-    # Known existing commands to prevent hallucination
-    known_cmds = ", ".join(EXISTING_COMMANDS[:12])
+    diff_content = "\n\n".join(diff_sections)
     
     if lang == "ru":
-        prompt = f"""Ты пишешь changelog для пользователей.
-
-СТРОГИЕ ПРАВИЛА:
-1) Пиши ТОЛЬКО о реальных изменениях в коде - что именно починили или улучшили
-2) Если изменений мало → напиши ОДНО предложение или пропусти
-3) НИКОГДА не придумывай новые команды или фичи которых нет в коде!
-4) Не вымучивай пункты - максимум 2-3 если есть реальные изменения
-5) Фокусируйся на: исправленных багах, починенных командах, улучшенной логике работы
-
-УЖЕ СУЩЕСТВУЮЩИЕ: {known_cmds}...
-
-Изменённые файлы ({num_changes} шт.):
-
-{diff_content}
-
-Напиши changelog на русском. Будь конкретным - опиши что именно починили, но сохраняй лёгкий сарказм в духе "мы это сделали, и вроде работает"."""
-
+        prompt = "".join((
+            _PROMPT_PREFIX_RU,
+            f"Изменённые файлы ({num_changes} шт.):\n\n",
+            diff_content,
+            _PROMPT_SUFFIX_RU,
+        ))
     else:
-        prompt = f"""You are a cynical PM with 20 years of experience writing release notes. Your style: sarcastic but informative. No fluff or technical jargon.
-
-ANALYZE THE CODE and identify what changed for USERS:
-- New commands (cmd_* functions) — what the command does in simple words
-- Improvements to existing commands — what got better
-- Fixed bugs — what was broken and now works
-- New features — how this helps the user
-
-RULES:
-1. Write ONLY about REAL changes in the code below
-2. DO NOT invent commands or features that don't exist
-3. Write in plain language, like for a friend, not a programmer
-4. Maximum 5 items, significant changes only
-5. Format: "- Brief name: what changed and why it matters to users"
-6. No repetitive "- What:" at the start, each item should be unique
-
-Changed files:
-{diff_content}
-
-Write changelog in English. Be specific but keep a light sarcastic tone like "we did this thing and it sort of works"."""
-
+        prompt = "".join((_PROMPT_PREFIX_EN, diff_content, _PROMPT_SUFFIX_EN))
     
     try:
         if writer_bot and writer_bot.client:
@@ -222,9 +435,11 @@ Write changelog in English. Be specific but keep a light sarcastic tone like "we
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.1,
-                max_tokens=800
+                max_tokens=800,
+                stop=["\n6.", "\n\n\n"],
+                stream=True
             )
-            changelog = response.choices[0].message.content.strip()
+            changelog = read_changelog_stream(response).strip()
             
             # Add witty comment if changelog is meaningful
             if changelog and len(changelog) > 10 and "Internal" not in changelog:
@@ -275,6 +490,24 @@ def generate_user_friendly_fallback(analysis: Dict, lang: str = "ru") -> str:
     return "\n".join(lines)
 
 
+def tracked_files_older_than_cache(project_root: Path, data_dir: Path) -> bool:
+    """
+    True if every tracked file was last modified before code_hashes.json was written,
+    so nothing can have changed and the cache doesn't even need to be parsed.
+    """
+    try:
+        cache_mtime = os.stat(data_dir / "code_hashes.json").st_mtime_ns
+    except OSError:
+        return False
+    for rel_path in TRACKED_FILES:
+        try:
+            if os.stat(project_root / rel_path).st_mtime_ns >= cache_mtime:
+                return False
+        except OSError:
+            continue
+    return True
+
+
 def check_and_generate_changelog(project_root: Path, writer_bot, admin_id: int, lang: str = "ru", should_save_hashes: bool = True) -> Optional[str]:
     """
     Main entry point: check for changes and generate changelog.
@@ -296,21 +529,22 @@ def check_and_generate_changelog(project_root: Path, writer_bot, admin_id: int,
 
     try:
         data_dir = project_root / "data"
+        if tracked_files_older_than_cache(project_root, data_dir):
+            return None
         stored_hashes = load_stored_hashes(data_dir)
         changed_files = get_changed_files(project_root, stored_hashes)
         
         if not changed_files:
             return None
         
-        changelog = generate_changelog_with_llm(writer_bot, changed_files, project_root, lang)
+        # Rehash in the background while waiting on the LLM
+        with ThreadPoolExecutor(max_workers=1) as ex:
+            hashes_future = ex.submit(get_current_hashes, project_root, stored_hashes) if should_save_hashes else None
+            changelog = generate_changelog_with_llm(writer_bot, changed_files, project_root, lang)
         
         if should_save_hashes:
-            current_hashes = {}
-            for rel_path in TRACKED_FILES:
-                file_path = project_root / rel_path
-                if file_path.exists():
-                    current_hashes[rel_path] = calculate_file_hash(file_path)
-            save_hashes(data_dir, current_hashes)
+            save_hashes(data_dir, hashes_future.result())
+            save_file_backups(project_root, data_dir, changed_files)
         
         return changelog
 
@@ -1,21 +1,32 @@
+from functools import lru_cache
 from langdetect import detect_langs, DetectorFactory
 import re
 
+try:
+    import cld3  # pycld3: C++ classifier, much faster than langdetect
+    CLD3_AVAILABLE = True
+except ImportError:
+    CLD3_AVAILABLE = False
+
 DetectorFactory.seed = 0
 _CYRILLIC_RE = re.compile(r"[\u0400-\u04FF]")
 
+# Detection is deterministic (seed above), so results for repeated short
+# messages (buttons, commands, greetings) can be cached
+DETECT_CACHE_MAX_LEN = 512
+
 
 def _contains_cyrillic(text: str) -> bool:
     return bool(_CYRILLIC_RE.search(text))
 
 
-def detect_language(text: str):
-    """Return (lang_code, probability). Cyrillic -> 'ru' with high confidence."""
-    if not text or not text.strip():
-        return None, 0.0
-    if _contains_cyrillic(text):
-        return "ru", 0.99
+def _detect(text: str):
     try:
+        if CLD3_AVAILABLE:
+            result = cld3.get_language(text)
+            if result is None:
+                return None, 0.0
+            return result.language, float(result.probability)
         langs = detect_langs(text)
         if not langs:
             return None, 0.0
@@ -24,3 +35,23 @@ def detect_language(text: str):
     except Exception as e:
         print(f"Language detection error: {e}")
         return None, 0.0
+
+
+@lru_cache(maxsize=4096)
+def _detect_cached(text: str):
+    return _detect(text)
+
+
+def detect_language(text: str):
+    """Return (lang_code, probability). Cyrillic -> 'ru' with high confidence."""
+    if not text or not text.strip():
+        return None, 0.0
+    # str.isascii() is O(1) on CPython; ASCII-only text can't contain Cyrillic
+    if not text.isascii() and _contains_cyrillic(text):
+        return "ru", 0.99
+    if len(text) <= DETECT_CACHE_MAX_LEN:
+        return _detect_cached(text)
+    return _detect(text)
+
+
+detect_language.cache_clear = _detect_cached.cache_clear
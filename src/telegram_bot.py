@@ -4,35 +4,54 @@ Telegram bot for Writer's Tears — writing coach.
 
 import os
 import asyncio
+import hashlib
 import json
+import logging
 import random
 import io
+import sys
 import tempfile
+import time
+from array import array
 from pathlib import Path
+from types import MappingProxyType
 from typing import Optional, BinaryIO
+from collections import OrderedDict, defaultdict, deque
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
+from functools import lru_cache, partial
 
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 # Try multiple locations for .env file (server path first, then relative)
 env_paths = [
     Path("/root/bot2/writers-tears-bot/.env"),  # Server production path
     Path(__file__).parent.parent / ".env",      # Relative path from src/
     Path.cwd() / ".env",                        # Current working directory
 ]
+loaded_env_path = None
 for env_path in env_paths:
     if env_path.exists():
         load_dotenv(env_path)
-        print(f"Loaded .env from: {env_path}")
+        loaded_env_path = env_path
         break
 else:
     load_dotenv()  # Fallback to default behavior
-    print("Warning: .env file not found in standard locations, using default load_dotenv")
+
+# Configured after .env is loaded so LOG_LEVEL can come from it
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+if loaded_env_path:
+    logger.info("Loaded .env from: %s", loaded_env_path)
+else:
+    logger.warning(".env file not found in standard locations, using default load_dotenv")
 
 
 # Add src to path for imports when running as module
-import sys
-from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
 # Document processing imports (optional - graceful fallback if not installed)
@@ -48,10 +67,18 @@ try:
 except ImportError:
     DOCX_AVAILABLE = False
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 
 try:
     from aiogram import Bot, Dispatcher, types, F
-    from aiogram.filters import Command
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+    from aiogram.filters import Command, CommandObject
     from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
     from aiogram.utils.keyboard import ReplyKeyboardBuilder
     AIogram_AVAILABLE = True
@@ -64,30 +91,197 @@ from i18n import t
 from word_stats import add_word_count, get_stats, count_words, count_chars, reset_stats
 from code_reviewer import check_and_generate_changelog
 
-# Import init_cache functionality for auto-updating after restart
-import sys
-sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
-from init_code_cache import init_cache
+DATA_DIR = Path(__file__).parent.parent / "data"
+DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 DEFAULT_LANG = os.getenv("DEFAULT_LANG", "en")
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))  # Developer ID for feedback from .env
-print(f"DEBUG: ADMIN_ID loaded = {ADMIN_ID}")
+logger.debug("ADMIN_ID loaded = %s", ADMIN_ID)
+
+
+@lru_cache(maxsize=2048)
+def _t_cached(lang: str, key: str, kwargs_items: tuple) -> str:
+    return t(lang, key, **dict(kwargs_items))
 
 
+def _t(lang: str, key: str, **kwargs) -> str:
+    """Memoized t() for strings built on every message (kwargs must be hashable)."""
+    return _t_cached(lang, key, tuple(sorted(kwargs.items())))
+
+
+# Built main keyboards per language (the buttons are static)
+_MAIN_KB: dict = {}
+
 
 def get_main_keyboard(lang: str = "en") -> ReplyKeyboardMarkup:
+    kb = _MAIN_KB.get(lang)
+    if kb is None:
+        kb = _MAIN_KB[lang] = _build_main_keyboard(lang)
+    return kb
+
+
+@lru_cache(maxsize=None)
+def get_summary_keyboard(lang: str, columns: int) -> ReplyKeyboardMarkup:
+    """Summary format buttons (built once per language and layout)."""
+    builder = ReplyKeyboardBuilder()
+    for key in SUMMARY_BUTTON_KEYS:
+        builder.add(KeyboardButton(text=t(lang, key)))
+    builder.adjust(columns)
+    return builder.as_markup(resize_keyboard=True)
+
+
+def _build_main_keyboard(lang: str) -> ReplyKeyboardMarkup:
     builder = ReplyKeyboardBuilder()
-    builder.add(KeyboardButton(text=t(lang, "button_prompt")))
-    builder.add(KeyboardButton(text=t(lang, "button_idea")))
-    builder.add(KeyboardButton(text=t(lang, "button_methodique")))
-    builder.add(KeyboardButton(text=t(lang, "button_help")))
+    builder.add(KeyboardButton(text=_t(lang, "button_prompt")))
+    builder.add(KeyboardButton(text=_t(lang, "button_idea")))
+    builder.add(KeyboardButton(text=_t(lang, "button_methodique")))
+    builder.add(KeyboardButton(text=_t(lang, "button_help")))
     builder.adjust(2)
     return builder.as_markup(resize_keyboard=True)
 
 
+# Reply-keyboard buttons checked on every text message
+SUMMARY_BUTTON_KEYS = ("btn_summary_sentence", "btn_summary_paragraph", "btn_summary_two_paragraphs", "btn_summary_detailed")
+MAIN_BUTTON_KEYS = ("button_methodique", "button_prompt", "button_idea", "button_help")
+
+
+@lru_cache(maxsize=None)
+def _button_texts(lang: str, keys: tuple) -> frozenset:
+    """Texts of the given buttons in `lang`, built once per language."""
+    return frozenset(t(lang, key) for key in keys)
+
+
+# Summary format buttons -> instruction key (RU and EN buttons regardless of the user's lang)
+SUMMARY_FORMATS = MappingProxyType({
+    t(lang, button): instr_key
+    for lang in ("ru", "en")
+    for button, instr_key in (
+        ("btn_summary_sentence", "instr_summary_one_sentence"),
+        ("btn_summary_paragraph", "instr_summary_one_paragraph"),
+        ("btn_summary_two_paragraphs", "instr_summary_two_paragraphs"),
+        ("btn_summary_detailed", "instr_summary_detailed_full"),
+    )
+})
+
+
+# Recent daily quotes remembered per user to avoid repeats
+CITE_HISTORY_SIZE = 150
+
+
+@dataclass(slots=True)
+class UserState:
+    """Per-user runtime state (not persisted), kept in one object per user."""
+    state: str = "chat"
+    accumulated_text: Optional[str] = None  # multi-message input; None: not accumulating
+    last_message: str = ""
+    error_count: int = 0  # consecutive errors
+    error_cooldown: Optional[float] = None  # cooldown until (time.monotonic())
+    cite_enabled: Optional[bool] = None  # None: never set
+    cite_history: deque = field(default_factory=lambda: deque(maxlen=CITE_HISTORY_SIZE))  # recent quotes, oldest first
+    cite_seen: set[str] = field(default_factory=set)  # quotes in cite_history, for O(1) lookup
+    cite_last_time: Optional[datetime] = None
+    cite_count: int = 0  # Number of auto-quotes sent
+    last_activity: Optional[datetime] = None
+    pending_broadcast: Optional[str] = None  # admin broadcast text awaiting confirmation
+    wb_lock: asyncio.Lock = field(default_factory=asyncio.Lock)  # one WriterBot call at a time per user
+
+
+class SendRateLimiter:
+    """Spaces out sends so that at most `rate` start per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.next_time = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        slot = max(now, self.next_time)
+        self.next_time = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
 class TelegramWriterBot:
     """Telegram front-end for Writer's Tears."""
 
+    # Unified state configuration: state_name -> (min_length, handler_method_name or None)
+    # This eliminates duplication across waiting_states, accumulation_states, and state_handlers
+    STATE_CONFIG = MappingProxyType({
+        # Accumulation states (processed on /done)
+        "feedback": (20, "feedback_on_text"),
+
+        "style": (20, "analyze_style"),
+        "roast": (50, "roast"),
+        "praise": (50, "praise"),
+        "corrector_wait": (3, "correct_text"),
+        "editor_wait": (5, "edit_text"),
+        "methodique_wait": (5, "methodique"),
+        "count_me_wait": (1, None),  # Special handling
+        "block_wait": (1, "handle_block"),
+        "develop_wait": (1, "develop_idea"),
+        "character_wait": (1, "character_help"),
+        "dialogue_wait": (1, "dialogue_help"),
+        "summary_wait": (10, None),  # Special handling with buttons
+        "dev_feedback_wait": (1, None),  # Special handling
+    })
+
+    # Text-analysis commands handled by _handle_text_cmd: command -> accumulation state
+    # (min length and WriterBot method come from STATE_CONFIG, prompt from "<command>_prompt")
+    TEXT_COMMANDS = MappingProxyType({
+        "feedback": "feedback",
+        "style": "style",
+        "roast": "roast",
+        "praise": "praise",
+        "corrector": "corrector_wait",
+        "editor": "editor_wait",
+    })
+
+    # Additional states for summary format selection (after /done or after /summary on file)
+    SUMMARY_FORMAT_STATE = "summary_format"
+
+    # Discussion states: for discussing results while keeping tool context
+
+    # Maps discussion state -> (original tool state, instruction_key)
+    DISCUSSION_STATES = MappingProxyType({
+        "feedback_discuss": ("feedback", "instr_feedback"),
+        "style_discuss": ("style", "instr_style"),
+        "roast_discuss": ("roast", "instr_roast"),
+        "praise_discuss": ("praise", "instr_praise"),
+        "corrector_discuss": ("corrector_wait", "instr_corrector"),
+        "editor_discuss": ("editor_wait", "instr_editor"),
+        "methodique_discuss": ("methodique_wait", "instr_methodique"),
+        "summary_discuss": ("summary_wait", None),
+    })
+
+    # States that require user input (waiting states)
+    WAITING_STATES = frozenset(STATE_CONFIG) | frozenset(DISCUSSION_STATES) | {"cry_baby", "document_wait", SUMMARY_FORMAT_STATE}
+
+    # Delay before writing changed user preferences (changes made meanwhile are written together)
+    PREFS_FLUSH_SECONDS = 2
+
+    # Concurrent sends during broadcasts (Telegram allows ~30 messages/s per bot)
+    BROADCAST_CONCURRENCY = 20
+    # Refresh the admin broadcast status message at most this often
+    BROADCAST_PROGRESS_SECONDS = 2
+    # Global cap on broadcast sends per second
+    BROADCAST_RATE = 30
+
+    # Auto porko/lobster posts are spread over this many seconds across group chats
+    AUTO_POST_JITTER_SECONDS = 60
+
+    # Pooled HTTP connections shared by polling and all outgoing requests
+    HTTP_CONNECTION_LIMIT = 64
+
+    # Telegram shows a chat action for ~5 s, so don't resend it more often than this
+    CHAT_ACTION_SECONDS = 4
+
+    # Only show "typing" for WriterBot calls that take longer than this
+    TYPING_DELAY_SECONDS = 0.3
+
+    # Cached text-analysis replies (same user, language, command and text)
+    WB_CACHE_SIZE = 512
+    WB_CACHE_TTL_SECONDS = 3600
+
     def __init__(
         self,
         telegram_token: str,
@@ -100,18 +294,17 @@ class TelegramWriterBot:
             raise RuntimeError("aiogram not installed. pip install aiogram")
 
         self.telegram_token = telegram_token
-        self.bot = Bot(token=telegram_token)
+        self.admin_id = ADMIN_ID
+        self.default_lang = DEFAULT_LANG
+        # One persistent, pooled session for the bot's lifetime (closed when polling stops)
+        self.bot = Bot(token=telegram_token, session=AiohttpSession(limit=self.HTTP_CONNECTION_LIMIT))
         self.dp = Dispatcher()
         self.sessions: dict[int, WriterBot] = {}
         self.user_langs: dict[int, str] = {}
-        self.user_states: dict[int, str] = {}
-        self.last_user_message: dict[int, str] = {}
-        self.accumulated_text: dict[int, str] = {}  # For multi-message input
+        self.users: defaultdict[int, UserState] = defaultdict(UserState)  # state, input, errors, quotes
         
         # Error tracking for spam protection
 
-        self.user_error_count: dict[int, int] = {}  # consecutive errors per user
-        self.user_error_cooldown: dict[int, datetime] = {}  # cooldown until time
         self.error_cooldown_seconds: int = 30  # cooldown after errors
         self.max_consecutive_errors: int = 3  # errors before cooldown
         self.llm_model = llm_model
@@ -119,27 +312,30 @@ class TelegramWriterBot:
         self.llm_api_base = llm_api_base
         self.use_rag = use_rag
         self.bot_username: Optional[str] = None
+        self.bot_mention: Optional[str] = None  # "@username", lowercased, for mention checks
         self.bot_user_id: Optional[int] = None
         
-        # Auto-activation tracking for group chats (chat_id -> last_activation_time)
-        self.last_auto_activation: dict[int, datetime] = {}
+        # Auto-activation tracking for group chats (chat_id -> last activation, time.monotonic())
+        self.last_auto_activation: dict[int, float] = {}
         self.auto_activation_task: Optional[asyncio.Task] = None
         
         # Auto porko/lobster in group chats - track group chats for random messages
         self.group_chats: set[int] = set()  # chat_ids where bot is active
-        self.last_porko_lobster: dict[int, datetime] = {}  # last time porko/lobster sent per chat
+        self.last_porko_lobster: dict[int, float] = {}  # last time porko/lobster sent per chat (time.monotonic())
         self.porko_lobster_task: Optional[asyncio.Task] = None
         
+        # Last "typing" action per chat (time.monotonic())
+        self.last_chat_action: dict[int, float] = {}
+        self.typing_tasks: set[asyncio.Task] = set()  # fire-and-forget chat actions in flight
+        self.send_tasks: set[asyncio.Task] = set()  # detached multi-message sends in flight
+        self.broadcast_limiter = SendRateLimiter(self.BROADCAST_RATE)
+        self.wb_cache: OrderedDict[tuple, tuple[float, str]] = OrderedDict()  # key -> (time.monotonic(), reply)
+        
         # Group chat availability toggle (admin only)
         self.group_chats_enabled: bool = True
         
         # Daily quotes tracking (session-only, no persistence)
-        self.user_cite_enabled: dict[int, bool] = {}
-        self.user_cite_history: dict[int, list[str]] = {}
-        self.user_cite_last_time: dict[int, datetime] = {}
-        self.user_cite_count: dict[int, int] = {} # Number of auto-quotes sent
-        self.user_last_activity: dict[int, datetime] = {}
-        self.bot_last_activity: datetime = datetime.now()  # Track bot's own activity
+        self.bot_last_activity: float = time.monotonic()  # Track bot's own activity
         self.AUTO_DISABLE_DAYS: int = 17 # Days of inactivity before auto-disable
         self.pending_changelog: Optional[str] = None  # Store changelog to show to users
         
@@ -147,54 +343,16 @@ class TelegramWriterBot:
         self.all_users: set[int] = set()
         
         # User preferences persistence (copied from therapist bot)
-        self.prefs_path = Path(__file__).parent.parent / "data" / "user_prefs.json"
+        self.prefs_path = DATA_DIR / "user_prefs.json"
+        self._prefs_dirty: bool = False
+        self._prefs_changed = asyncio.Event()  # wakes the flush task
+        self.prefs_flush_task: Optional[asyncio.Task] = None
+        self.prefs_write_task: Optional[asyncio.Future] = None  # last threaded prefs write
         self._load_user_prefs()
         
         # Changelog cooldown tracking
         self.changelog_cooldown_hours: int = 1  # Minimum hours between changelogs
-        self.changelog_last_sent_path = Path(__file__).parent.parent / "data" / "changelog_last_sent.txt"
-
-        # Unified state configuration: state_name -> (min_length, handler_method_name or None)
-        # This eliminates duplication across waiting_states, accumulation_states, and state_handlers
-        self.STATE_CONFIG = {
-            # Accumulation states (processed on /done)
-            "feedback": (20, "feedback_on_text"),
-
-            "style": (20, "analyze_style"),
-            "roast": (50, "roast"),
-            "praise": (50, "praise"),
-            "corrector_wait": (3, "correct_text"),
-            "editor_wait": (5, "edit_text"),
-            "methodique_wait": (5, "methodique"),
-            "count_me_wait": (1, None),  # Special handling
-            "block_wait": (1, "handle_block"),
-            "develop_wait": (1, "develop_idea"),
-            "character_wait": (1, "character_help"),
-            "dialogue_wait": (1, "dialogue_help"),
-            "summary_wait": (10, None),  # Special handling with buttons
-            "dev_feedback_wait": (1, None),  # Special handling
-        }
-
-        # Additional states for summary format selection (after /done or after /summary on file)
-        self.SUMMARY_FORMAT_STATE = "summary_format"
-        
-        # Discussion states: for discussing results while keeping tool context
-
-        # Maps discussion state -> (original tool state, instruction_key)
-        self.DISCUSSION_STATES = {
-            "feedback_discuss": ("feedback", "instr_feedback"),
-            "style_discuss": ("style", "instr_style"),
-            "roast_discuss": ("roast", "instr_roast"),
-            "praise_discuss": ("praise", "instr_praise"),
-            "corrector_discuss": ("corrector_wait", "instr_corrector"),
-            "editor_discuss": ("editor_wait", "instr_editor"),
-            "methodique_discuss": ("methodique_wait", "instr_methodique"),
-            "summary_discuss": ("summary_wait", None),
-        }
-        
-        # States that require user input (waiting states)
-        self.WAITING_STATES = set(self.STATE_CONFIG.keys()) | set(self.DISCUSSION_STATES.keys()) | {"cry_baby", "document_wait", self.SUMMARY_FORMAT_STATE}
-
+        self.changelog_last_sent_path = DATA_DIR / "changelog_last_sent.txt"
 
         self._register_handlers()
 
@@ -204,13 +362,14 @@ class TelegramWriterBot:
         try:
             bot_info = await self.bot.get_me()
             self.bot_username = bot_info.username
+            self.bot_mention = f"@{bot_info.username.lower()}" if bot_info.username else None
             self.bot_user_id = bot_info.id
-            print(f"Bot started: @{self.bot_username} (ID: {self.bot_user_id})")
+            logger.info("Bot started: @%s (ID: %s)", self.bot_username, self.bot_user_id)
         except Exception as e:
-            print(f"Failed to get bot info: {e}")
+            logger.error("Failed to get bot info: %s", e)
         
         # Check for code changes and generate changelog
-        project_root = Path(__file__).parent.parent
+        project_root = DATA_DIR.parent
         try:
             # Create a temporary writer bot for LLM calls
             wb = WriterBot(
@@ -223,7 +382,7 @@ class TelegramWriterBot:
             changelog = check_and_generate_changelog(
                 project_root=project_root,
                 writer_bot=wb,
-                admin_id=ADMIN_ID,
+                admin_id=self.admin_id,
                 lang="ru",
                 should_save_hashes=True
             )
@@ -231,7 +390,7 @@ class TelegramWriterBot:
                 # Store changelog and wait for admin confirmation
                 self.pending_changelog = changelog
                 # Send preview to admin for confirmation
-                if ADMIN_ID:
+                if self.admin_id:
                     preview = (
                         f"<b>Changelog Preview</b>\n\n"
                         f"{changelog[:300]}{'...' if len(changelog) > 300 else ''}\n\n"
@@ -241,66 +400,198 @@ class TelegramWriterBot:
 
                     try:
                         await self.bot.send_message(
-                            ADMIN_ID,
+                            self.admin_id,
                             preview,
                             parse_mode="HTML"
                         )
-                        self.user_states[ADMIN_ID] = "changelog_confirm"
-                        print(f"Changelog generated, waiting for admin {ADMIN_ID} confirmation")
+                        self.users[self.admin_id].state = "changelog_confirm"
+                        logger.info("Changelog generated, waiting for admin %s confirmation", self.admin_id)
                     except Exception as e:
-                        print(f"Failed to send changelog preview to admin: {e}")
+                        logger.error("Failed to send changelog preview to admin: %s", e)
                 else:
-                    print("Changelog generated but no ADMIN_ID set, skipping broadcast")
+                    logger.warning("Changelog generated but no ADMIN_ID set, skipping broadcast")
 
 
 
         except Exception as e:
-            print(f"Changelog check failed: {e}")
+            logger.error("Changelog check failed: %s", e)
         
         # Start polling
         # Start background task for auto porko/lobster in group chats
         self.porko_lobster_task = asyncio.create_task(self._porko_lobster_background_loop())
+        self.prefs_flush_task = asyncio.create_task(self._prefs_flush_loop())
         
-        await self.dp.start_polling(self.bot)
+        try:
+            await self.dp.start_polling(self.bot)
+        finally:
+            self.prefs_flush_task.cancel()
+            self.prefs_flush_task = None
+            # Cancelling doesn't stop a write already running in a thread: let it finish,
+            # so it can't replace the file after the final write below
+            if self.prefs_write_task is not None:
+                await asyncio.gather(self.prefs_write_task, return_exceptions=True)
+            self._flush_user_prefs()
 
     def _load_user_prefs(self):
         """Load user preferences from JSON file."""
         try:
-            self.prefs_path.parent.mkdir(parents=True, exist_ok=True)
             if self.prefs_path.exists():
-                with open(self.prefs_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.user_langs = {int(k): v for k, v in data.get('user_langs', {}).items()}
-                    self.all_users = set(int(k) for k in data.get('all_users', []))
-                    
-                    # Migrate old users: add all user_langs keys to all_users
-                    # This ensures existing users get broadcasts without needing to /start again
-                    for user_id in self.user_langs.keys():
-                        if user_id not in self.all_users:
-                            self.all_users.add(user_id)
-                    
-                    # Save if we added any users
-                    if len(self.all_users) > len(set(int(k) for k in data.get('all_users', []))):
-                        self._save_user_prefs()
+                if ORJSON_AVAILABLE:
+                    data = orjson.loads(self.prefs_path.read_bytes())
+                else:
+                    with open(self.prefs_path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                self.user_langs = {int(k): v for k, v in data.get('user_langs', {}).items()}
+                self.all_users = set(map(int, data.get('all_users', [])))
+                
+                # Migrate old users: add all user_langs keys to all_users
+                # This ensures existing users get broadcasts without needing to /start again
+                missing_users = self.user_langs.keys() - self.all_users
+                if missing_users:
+                    self.all_users |= missing_users
+                    self._save_user_prefs()
         except Exception:
             self.user_langs = getattr(self, "user_langs", {}) or {}
             self.all_users = getattr(self, "all_users", set()) or set()
 
     def _save_user_prefs(self):
-        """Save user preferences to JSON file."""
+        """Mark user preferences for saving.
+        
+        While the bot is running, the background flush task writes them PREFS_FLUSH_SECONDS
+        after the first change, off the event loop; before that, save right away.
+        """
+        self._prefs_dirty = True
+        if self.prefs_flush_task is None:
+            self._flush_user_prefs()
+        else:
+            self._prefs_changed.set()
+
+    def _user_prefs_payload(self) -> dict:
+        return {
+            'user_langs': dict(self.user_langs),  # int keys: serialized as strings
+            'all_users': list(self.all_users),
+        }
+
+    def _write_user_prefs(self, payload: dict):
+        """Write user preferences to JSON file (atomically, via temp file + os.replace)."""
         try:
-            payload = {
-                'user_langs': {str(k): v for k, v in self.user_langs.items()},
-                'all_users': list(self.all_users),
-            }
-            with open(self.prefs_path, 'w', encoding='utf-8') as f:
-                json.dump(payload, f, ensure_ascii=False, indent=2)
+            tmp_path = self.prefs_path.with_suffix(".json.tmp")
+            if ORJSON_AVAILABLE:
+                tmp_path.write_bytes(orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS))
+            else:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, self.prefs_path)
         except Exception:
             pass
 
+    def _flush_user_prefs(self):
+        """Save user preferences now, if anything changed."""
+        if self._prefs_dirty:
+            self._prefs_dirty = False
+            self._write_user_prefs(self._user_prefs_payload())
+
+    async def _prefs_flush_loop(self):
+        """Background task: write changed user preferences, sleeping while nothing changes."""
+        while True:
+            await self._prefs_changed.wait()
+            await asyncio.sleep(self.PREFS_FLUSH_SECONDS)
+            self._prefs_changed.clear()
+            if self._prefs_dirty:
+                self._prefs_dirty = False
+                # Snapshot on the loop, write in a thread (shielded: shutdown waits for it)
+                self.prefs_write_task = asyncio.ensure_future(
+                    asyncio.to_thread(self._write_user_prefs, self._user_prefs_payload())
+                )
+                await asyncio.shield(self.prefs_write_task)
+
+    def _lang_of(self, user_id: int) -> str:
+        """User's language, or the default if they haven't picked one."""
+        return self.user_langs.get(user_id, self.default_lang)
+
+    async def _send_typing(self, chat_id: int):
+        """Show "typing" in a chat, unless it is still shown from the last call."""
+        now = time.monotonic()
+        if now - self.last_chat_action.get(chat_id, float("-inf")) < self.CHAT_ACTION_SECONDS:
+            return
+        self.last_chat_action[chat_id] = now
+        await self.bot.send_chat_action(chat_id=chat_id, action="typing")
+
+    def _start_typing(self, chat_id: int):
+        """Like _send_typing, but without waiting for Telegram's reply."""
+        task = asyncio.create_task(self._send_typing(chat_id))
+        self.typing_tasks.add(task)
+        task.add_done_callback(self._typing_task_done)
+
+    def _typing_task_done(self, task: asyncio.Task):
+        self.typing_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.debug("Chat action failed: %s", task.exception())
+
+    async def _send_chunks_delayed(self, chat_id: int, chunks: list[str], delay: float = 0.8, **kwargs):
+        """Send non-empty chunks one by one with a pause between them."""
+        chunks = [c for c in chunks if c and c.strip()]
+        for i, chunk in enumerate(chunks):
+            await self.bot.send_message(chat_id=chat_id, text=chunk, **kwargs)
+            if i < len(chunks) - 1:
+                await asyncio.sleep(delay)
+
+    def _start_sending_chunks(self, chat_id: int, chunks: list[str], **kwargs):
+        """Like _send_chunks_delayed, but returns at once so the handler isn't held up."""
+        task = asyncio.create_task(self._send_chunks_delayed(chat_id, chunks, **kwargs))
+        self.send_tasks.add(task)
+        task.add_done_callback(self._send_task_done)
+
+    def _send_task_done(self, task: asyncio.Task):
+        self.send_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error("Delayed send failed: %s", task.exception())
+
+    async def _run_wb(self, user_id: Optional[int], fn, *args, **kwargs):
+        """Run a blocking call on user_id's WriterBot in a thread, one at a time per user
+        (the session's history and summary aren't safe to update from two threads).
+        user_id None: the call doesn't touch session state, so it runs without the lock."""
+        if user_id is None:
+            return await asyncio.to_thread(fn, *args, **kwargs)
+        async with self.users[user_id].wb_lock:
+            return await asyncio.to_thread(fn, *args, **kwargs)
+
+    async def _run_with_typing(self, chat_id: int, user_id: Optional[int], fn, *args, **kwargs):
+        """_run_wb that shows "typing" only if the call hasn't finished within
+        TYPING_DELAY_SECONDS (fast replies skip the request)."""
+        task = asyncio.ensure_future(self._run_wb(user_id, fn, *args, **kwargs))
+        done, _ = await asyncio.wait({task}, timeout=self.TYPING_DELAY_SECONDS)
+        if not done:
+            self._start_typing(chat_id)
+        return await task
+
+    async def _run_cached(self, chat_id: int, user_id: int, method: str, text: str, **kwargs) -> str:
+        """_run_with_typing for WriterBot text-analysis methods, reusing the reply when the
+        same user runs the same command on the same text again (e.g. several commands on one upload)."""
+        wb = self._get_writer_bot(user_id)
+        digest = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        key = (user_id, wb.language, method, digest, tuple(sorted(kwargs.items())))
+        now = time.monotonic()
+        hit = self.wb_cache.get(key)
+        if hit is not None and now - hit[0] < self.WB_CACHE_TTL_SECONDS:
+            self.wb_cache.move_to_end(key)
+            return hit[1]
+        reply = await self._run_with_typing(chat_id, user_id, getattr(wb, method), text, **kwargs)
+        if reply and not reply.startswith("Error"):
+            self.wb_cache[key] = (now, reply)
+            self.wb_cache.move_to_end(key)
+            if len(self.wb_cache) > self.WB_CACHE_SIZE:
+                self.wb_cache.popitem(last=False)
+        return reply
+
+    def _drop_cached_replies(self, user_id: int):
+        """Forget user_id's cached replies (their session was reset or changed language)."""
+        for key in [key for key in self.wb_cache if key[0] == user_id]:
+            del self.wb_cache[key]
+
     def _get_writer_bot(self, user_id: int) -> WriterBot:
         # Always get current language from user_langs to ensure it's up-to-date
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
+        lang = self._lang_of(user_id)
         
         # Create new session if needed OR if language changed
         if user_id not in self.sessions:
@@ -323,203 +614,75 @@ class TelegramWriterBot:
         return self.sessions[user_id]
 
     def _register_handlers(self):
-
-        @self.dp.message(Command("start"))
-        async def cmd_start(message: types.Message):
-            await self._handle_start(message)
-
-
-        @self.dp.message(Command("help"))
-        async def cmd_help(message: types.Message):
-            await self._handle_help(message)
-
-        @self.dp.message(Command("lang"))
-        async def cmd_lang(message: types.Message):
-            await self._handle_lang(message)
-
-        @self.dp.message(Command("switchlang"))
-        async def cmd_switchlang(message: types.Message):
-            await self._handle_switchlang(message)
-
-        @self.dp.message(Command("reset"))
-        async def cmd_reset(message: types.Message):
-            await self._handle_reset(message)
-
-        @self.dp.message(Command("block"))
-        async def cmd_block(message: types.Message):
-            await self._handle_block(message)
-
-        @self.dp.message(Command("develop"))
-        async def cmd_develop(message: types.Message):
-            await self._handle_develop(message)
-
-        @self.dp.message(Command("character"))
-        async def cmd_character(message: types.Message):
-            await self._handle_character(message)
-
-        @self.dp.message(Command("dialogue"))
-        async def cmd_dialogue(message: types.Message):
-            await self._handle_dialogue(message)
-
-        @self.dp.message(Command("prompt"))
-        async def cmd_prompt(message: types.Message):
-            await self._handle_prompt(message)
-
-        @self.dp.message(Command("idea"))
-        async def cmd_idea(message: types.Message):
-            await self._handle_idea(message)
-
-        @self.dp.message(Command("feedback"))
-        async def cmd_feedback(message: types.Message):
-            await self._handle_feedback_cmd(message)
-
-        @self.dp.message(Command("style"))
-        async def cmd_style(message: types.Message):
-            await self._handle_style_cmd(message)
-
-        @self.dp.message(Command("roast"))
-        async def cmd_roast(message: types.Message):
-            await self._handle_roast(message)
-
-        @self.dp.message(Command("praise"))
-        async def cmd_praise(message: types.Message):
-            await self._handle_praise(message)
-
-        @self.dp.message(Command("corrector"))
-        async def cmd_corrector(message: types.Message):
-            await self._handle_corrector(message)
-
-        @self.dp.message(Command("editor"))
-        async def cmd_editor(message: types.Message):
-            await self._handle_editor(message)
-
-        @self.dp.message(Command("count_me"))
-        async def cmd_count_me(message: types.Message):
-            await self._handle_count_me(message)
-
-        @self.dp.message(Command("stats"))
-        async def cmd_stats(message: types.Message):
-            await self._handle_stats(message)
-
-        @self.dp.message(Command("lobster"))
-        async def cmd_lobster(message: types.Message):
-            await self._handle_lobster(message)
-
-        @self.dp.message(Command("pun"))
-        async def cmd_pun(message: types.Message):
-            await self._handle_pun(message)
-
-        @self.dp.message(Command("porko"))
-        async def cmd_porko(message: types.Message):
-            await self._handle_porko(message)
-
-        @self.dp.message(Command("methodique"))
-        @self.dp.message(Command("methodichque"))
-        async def cmd_methodique(message: types.Message):
-            await self._handle_methodique(message)
-
-        @self.dp.message(Command("cite"))
-        async def cmd_cite(message: types.Message):
-            await self._handle_cite(message)
-
-        @self.dp.message(Command("cite_off"))
-        async def cmd_cite_off(message: types.Message):
-            await self._handle_cite_off(message)
-
-        @self.dp.message(Command("cite_on"))
-        async def cmd_cite_on(message: types.Message):
-            await self._handle_cite_on(message)
-
-        @self.dp.message(Command("cite_when"))
-        async def cmd_cite_when(message: types.Message):
-            await self._handle_cite_when(message)
-
-        @self.dp.message(Command("summary"))
-        async def cmd_summary(message: types.Message):
-            await self._handle_summary(message)
-
-        @self.dp.message(Command("cry_baby"))
-        async def cmd_cry_baby(message: types.Message):
-            await self._handle_cry_baby(message)
-
-        @self.dp.message(Command("admin"))
-        async def cmd_admin(message: types.Message):
-            await self._handle_admin(message)
-
-        @self.dp.message(Command("dev_feedback"))
-        async def cmd_dev_feedback(message: types.Message):
-            await self._handle_dev_feedback(message)
-
-        @self.dp.message(Command("done"))
-        async def cmd_done(message: types.Message):
-            await self._handle_done(message)
-
-        @self.dp.message(Command("confo_enable37"))
-        async def cmd_confo_enable37(message: types.Message):
-            await self._handle_confo_toggle(message)
-
-        @self.dp.message(Command("debug"))
-        async def cmd_debug(message: types.Message):
-            await self._handle_debug(message)
-
-        @self.dp.message(Command("upload"))
-
-        async def cmd_upload(message: types.Message):
-            await self._handle_upload_cmd(message)
+        # Commands whose argument (text after the command) the handler needs
+        def with_args(handler):
+            async def cmd_with_args(message: types.Message, command: CommandObject):
+                await handler(message, (command.args or "").strip())
+            return cmd_with_args
+
+        # Command -> handler; aiogram calls bound methods directly
+        command_handlers = {
+            "start": self._handle_start,
+            "help": self._handle_help,
+            "lang": self._handle_lang,
+            "switchlang": self._handle_switchlang,
+            "reset": self._handle_reset,
+            "block": with_args(self._handle_block),
+            "develop": with_args(self._handle_develop),
+            "character": with_args(self._handle_character),
+            "dialogue": with_args(self._handle_dialogue),
+            "prompt": self._handle_prompt,
+            "idea": self._handle_idea,
+            "feedback": with_args(partial(self._handle_text_cmd, cmd="feedback")),
+            "style": with_args(partial(self._handle_text_cmd, cmd="style")),
+            "roast": with_args(partial(self._handle_text_cmd, cmd="roast")),
+            "praise": with_args(partial(self._handle_text_cmd, cmd="praise")),
+            "corrector": with_args(partial(self._handle_text_cmd, cmd="corrector")),
+            "editor": with_args(partial(self._handle_text_cmd, cmd="editor")),
+            "count_me": with_args(self._handle_count_me),
+            "stats": self._handle_stats,
+            "lobster": self._handle_lobster,
+            "pun": self._handle_pun,
+            "porko": self._handle_porko,
+            "methodique": with_args(self._handle_methodique),
+            "methodichque": with_args(self._handle_methodique),
+            "cite": self._handle_cite,
+            "cite_off": self._handle_cite_off,
+            "cite_on": self._handle_cite_on,
+            "cite_when": self._handle_cite_when,
+            "summary": self._handle_summary,
+            "cry_baby": self._handle_cry_baby,
+            "admin": self._handle_admin,
+            "dev_feedback": with_args(self._handle_dev_feedback),
+            "done": self._handle_done,
+            "confo_enable37": self._handle_confo_toggle,
+            "debug": self._handle_debug,
+            "upload": self._handle_upload_cmd,
+        }
+        for cmd, handler in command_handlers.items():
+            self.dp.message.register(handler, Command(cmd))
 
         # Document handler with DDoS protection
         @self.dp.message(F.document)
         async def handle_document(message: types.Message):
             await self._handle_document(message)
 
-        # Button handlers - explicit text matching for each language
-        # RU buttons
-
-
-
-        # Prompt button
-        @self.dp.message(
-            F.text.in_({
-                t("ru", "button_prompt"),
-                t("en", "button_prompt"),
-            })
-        )
-        async def btn_prompt(message: types.Message):
-            await self._handle_prompt(message)
-
-
-# Idea / Plot button
-        @self.dp.message(
-            F.text.in_({
-                t("ru", "button_idea"),
-                t("en", "button_idea"),
-            })
-        )
-        async def btn_idea(message: types.Message):
-            await self._handle_idea(message)
-
-
-# Methodique button
-        @self.dp.message(
-            F.text.in_({
-                t("ru", "button_methodique"),
-                t("en", "button_methodique"),
-            })
-        )
-        async def btn_methodique(message: types.Message):
-            await self._handle_methodique(message)
-
-
-# Help / Commands button
-        @self.dp.message(
-            F.text.in_({
-                t("ru", "button_help"),
-                t("en", "button_help"),
-            })
-        )
-        async def btn_help(message: types.Message):
-            await self._handle_help(message)
+        # Keyboard buttons: one filter for all button texts (every language),
+        # then an exact-text lookup of the handler
+        button_routes = {
+            t(lang, key): handler
+            for lang in ("ru", "en")
+            for key, handler in (
+                ("button_prompt", self._handle_prompt),
+                ("button_idea", self._handle_idea),
+                ("button_methodique", lambda message: self._handle_methodique(message, message.text)),
+                ("button_help", self._handle_help),
+            )
+        }
 
+        @self.dp.message(F.text.in_(frozenset(button_routes)))
+        async def handle_button(message: types.Message):
+            await button_routes[message.text](message)
 
         @self.dp.message(F.sticker)
         async def handle_sticker(message: types.Message):
@@ -533,11 +696,11 @@ class TelegramWriterBot:
     async def _handle_button(self, message: types.Message, key: str):
         user_id = message.from_user.id
         if key == "button_block":
-            await self._handle_block(message)
+            await self._handle_block(message, (message.text or "").strip())
         elif key == "button_idea":
             await self._handle_idea(message)
         elif key == "button_methodique":
-            await self._handle_methodique(message)
+            await self._handle_methodique(message, (message.text or "").strip())
         elif key == "button_help":
             await self._handle_help(message)
 
@@ -546,38 +709,40 @@ class TelegramWriterBot:
         user_id = message.from_user.id
         chat_id = message.chat.id
         name = message.from_user.first_name or "Writer"
-        self.user_states[user_id] = "chat"
+        self.users[user_id].state = "chat"
         
         # Track all users for broadcasts
+        prefs_changed = user_id not in self.all_users
         self.all_users.add(user_id)
-        self._save_user_prefs()
         
         # Set language from Telegram locale on first start, but don't override saved preference
         tg_lang = (message.from_user.language_code or "").lower()
         if user_id not in self.user_langs:
             if tg_lang.startswith("ru"):
                 self.user_langs[user_id] = "ru"
+                prefs_changed = True
             elif tg_lang.startswith("en"):
                 self.user_langs[user_id] = "en"
+                prefs_changed = True
+        if prefs_changed:
             self._save_user_prefs()
             
         # Enable daily quotes by default for new users
-        if user_id not in self.user_cite_enabled:
-            self.user_cite_enabled[user_id] = True
-            # Set last time to 24h ago so they get it soon
-            self.user_cite_last_time[user_id] = datetime.now() - timedelta(hours=24)
+        user = self.users[user_id]
+        if user.cite_enabled is None:
+            user.cite_enabled = True
         
         # Force clear history for this user to ensure a new quote is sent on /start
-        if user_id in self.user_cite_history:
-            self.user_cite_history[user_id] = []
+        user.cite_history.clear()
+        user.cite_seen.clear()
         # Reset last time to ensure immediate trigger
-        self.user_cite_last_time[user_id] = datetime.now() - timedelta(hours=25)
+        user.cite_last_time = datetime.now() - timedelta(hours=25)
         
         # Immediate quote for new users or those who haven't received one in 24h
         await self._check_and_send_daily_cite(user_id, chat_id)
 
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        welcome = t(lang, "welcome", name=name)
+        lang = self._lang_of(user_id)
+        welcome = _t(lang, "welcome", name=name)
 
         await message.answer(welcome, reply_markup=get_main_keyboard(lang), parse_mode="HTML")
 
@@ -585,18 +750,18 @@ class TelegramWriterBot:
     async def _handle_help(self, message: types.Message):
 
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        await message.answer(t(lang, "help"), parse_mode="HTML")
+        lang = self._lang_of(user_id)
+        await message.answer(_t(lang, "help"), parse_mode="HTML")
 
     async def _handle_lang(self, message: types.Message):
         """Handle /lang command - set or show language (copied from therapist bot)."""
         user_id = message.from_user.id
         parts = (message.text or "").split(None, 1)
         args = parts[1].strip().lower() if len(parts) > 1 else ""
-        current = self.user_langs.get(user_id, DEFAULT_LANG)
+        current = self._lang_of(user_id)
         
         if not args:
-            await message.answer(t(current, "lang_current", language=current))
+            await message.answer(_t(current, "lang_current", language=current))
             return
         
         if args in ("ru", "en"):
@@ -608,17 +773,18 @@ class TelegramWriterBot:
                 sess.system_prompt = sess._load_system_prompt()
                 # Clear prompts cache to load new language data
                 sess._clear_prompts_cache()
+            self._drop_cached_replies(user_id)
             # Persist
             self._save_user_prefs()
-            await message.answer(t(args, "lang_set", language=args), reply_markup=get_main_keyboard(args))
+            await message.answer(_t(args, "lang_set", language=args), reply_markup=get_main_keyboard(args))
             return
         
-        await message.answer(t(current, "lang_invalid"))
+        await message.answer(_t(current, "lang_invalid"))
 
     async def _handle_switchlang(self, message: types.Message):
         """Handle /switchlang command - toggle between ru and en."""
         user_id = message.from_user.id
-        current = self.user_langs.get(user_id, DEFAULT_LANG)
+        current = self._lang_of(user_id)
         new_lang = "en" if current == "ru" else "ru"
         self.user_langs[user_id] = new_lang
         
@@ -629,10 +795,11 @@ class TelegramWriterBot:
             sess.system_prompt = sess._load_system_prompt()
             # Clear prompts cache to load new language data
             sess._clear_prompts_cache()
+        self._drop_cached_replies(user_id)
         
         # Persist
         self._save_user_prefs()
-        response_text = t(new_lang, "lang_set", language=new_lang)
+        response_text = _t(new_lang, "lang_set", language=new_lang)
         await message.answer(response_text, reply_markup=get_main_keyboard(new_lang))
 
     async def _handle_reset(self, message: types.Message):
@@ -640,263 +807,116 @@ class TelegramWriterBot:
         chat_id = message.chat.id
         if user_id in self.sessions:
             self.sessions[user_id].reset()
-        self.user_states[user_id] = "chat"
+        self._drop_cached_replies(user_id)
+        self.users[user_id].state = "chat"
         # Reset word and character stats
         reset_stats(user_id)
         
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        await message.answer(t(lang, "reset_confirm"), reply_markup=get_main_keyboard(lang))
-
-    async def _handle_block(self, message: types.Message):
+        lang = self._lang_of(user_id)
+        await message.answer(_t(lang, "reset_confirm"), reply_markup=get_main_keyboard(lang))
 
+    async def _handle_block(self, message: types.Message, text: str):
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        text = (message.text or "").strip()
-        if not text or text == "/block":
-            self.user_states[user_id] = "block_wait"
-            await message.answer(t(lang, "block_prompt_empty"))
+        lang = self._lang_of(user_id)
+        if not text:
+            self.users[user_id].state = "block_wait"
+            await message.answer(_t(lang, "block_prompt_empty"))
             return
-        if text.startswith("/block"):
-            text = text.replace("/block", "").strip() or "I'm stuck."
-        await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
         wb = self._get_writer_bot(user_id)
-        reply = wb.handle_block(text)
-        self.user_states[user_id] = "chat"
+        reply = await self._run_with_typing(message.chat.id, user_id, wb.handle_block, text)
+        self.users[user_id].state = "chat"
         await message.answer(reply)
 
-    async def _handle_develop(self, message: types.Message):
+    async def _handle_develop(self, message: types.Message, text: str):
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        text = (message.text or "").strip().replace("/develop", "").strip()
+        lang = self._lang_of(user_id)
         if not text:
-            self.user_states[user_id] = "develop_wait"
-            await message.answer(t(lang, "develop_prompt_empty"))
+            self.users[user_id].state = "develop_wait"
+            await message.answer(_t(lang, "develop_prompt_empty"))
             return
-        await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-        reply = self._get_writer_bot(user_id).develop_idea(text)
-        self.user_states[user_id] = "chat"
+        reply = await self._run_with_typing(message.chat.id, user_id, self._get_writer_bot(user_id).develop_idea, text)
+        self.users[user_id].state = "chat"
         await message.answer(reply)
 
-    async def _handle_character(self, message: types.Message):
+    async def _handle_character(self, message: types.Message, text: str):
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        text = (message.text or "").strip().replace("/character", "").strip()
+        lang = self._lang_of(user_id)
         if not text:
-            self.user_states[user_id] = "character_wait"
-            await message.answer(t(lang, "character_prompt_empty"))
+            self.users[user_id].state = "character_wait"
+            await message.answer(_t(lang, "character_prompt_empty"))
             return
-        await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-        reply = self._get_writer_bot(user_id).character_help(text)
-        self.user_states[user_id] = "chat"
+        reply = await self._run_with_typing(message.chat.id, user_id, self._get_writer_bot(user_id).character_help, text)
+        self.users[user_id].state = "chat"
         await message.answer(reply)
 
-    async def _handle_dialogue(self, message: types.Message):
+    async def _handle_dialogue(self, message: types.Message, text: str):
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        text = (message.text or "").strip().replace("/dialogue", "").strip()
+        lang = self._lang_of(user_id)
         if not text:
-            self.user_states[user_id] = "dialogue_wait"
-            await message.answer(t(lang, "dialogue_prompt_empty"))
+            self.users[user_id].state = "dialogue_wait"
+            await message.answer(_t(lang, "dialogue_prompt_empty"))
             return
-        await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-        reply = self._get_writer_bot(user_id).dialogue_help(text)
-        self.user_states[user_id] = "chat"
+        reply = await self._run_with_typing(message.chat.id, user_id, self._get_writer_bot(user_id).dialogue_help, text)
+        self.users[user_id].state = "chat"
         await message.answer(reply)
 
     async def _handle_prompt(self, message: types.Message):
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        prompt = self._get_writer_bot(user_id).get_random_prompt()
-        await message.answer(f"{t(lang, 'prompt_label')}\n\n{prompt}")
+        lang = self._lang_of(user_id)
+        prompt = await self._run_wb(user_id, self._get_writer_bot(user_id).get_random_prompt)
+        await message.answer(f"{_t(lang, 'prompt_label')}\n\n{prompt}")
 
     async def _handle_idea(self, message: types.Message):
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        idea = self._get_writer_bot(user_id).generate_idea()
-        await message.answer(f"{t(lang, 'idea_label')}\n\n{idea}")
+        lang = self._lang_of(user_id)
+        idea = await self._run_wb(user_id, self._get_writer_bot(user_id).generate_idea)
+        await message.answer(f"{_t(lang, 'idea_label')}\n\n{idea}")
 
-    async def _handle_feedback_cmd(self, message: types.Message):
+    async def _run_on_document(self, message: types.Message, min_len: int, method: str) -> bool:
+        """If an uploaded document is waiting for a command, run WriterBot `method` on it.
+        Returns False (and does nothing) when there is no document."""
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        state = self.user_states.get(user_id, "chat")
-        
-        # Check if we have document text waiting
-        if state == "document_wait":
-            text = self.accumulated_text.get(user_id, "")
-            if len(text) < 20:
-                await message.answer(t(lang, "text_too_short", min=20))
-                return
-            await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-            reply = self._get_writer_bot(user_id).feedback_on_text(text)
-            self.user_states[user_id] = "chat"
-            del self.accumulated_text[user_id]
-            await message.answer(reply)
-            return
-        
-        text = (message.text or "").strip().replace("/feedback", "").strip()
-        if len(text) < 20:
-            self.user_states[user_id] = "feedback"
-            self.accumulated_text[user_id] = ""  # Start accumulation
-            await message.answer(t(lang, "feedback_prompt"))
-            return
-        await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-        reply = self._get_writer_bot(user_id).feedback_on_text(text)
-        self.user_states[user_id] = "chat"
-        await message.answer(reply)
-
-    async def _handle_style_cmd(self, message: types.Message):
-        user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        state = self.user_states.get(user_id, "chat")
-        
-        # Check if we have document text waiting
-        if state == "document_wait":
-            text = self.accumulated_text.get(user_id, "")
-            if len(text) < 20:
-                await message.answer(t(lang, "text_too_short", min=20))
-                return
-            await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-            reply = self._get_writer_bot(user_id).analyze_style(text)
-            self.user_states[user_id] = "chat"
-            del self.accumulated_text[user_id]
-            await message.answer(reply)
-            return
-        
-        text = (message.text or "").strip().replace("/style", "").strip()
-        if len(text) < 20:
-            self.user_states[user_id] = "style"
-            self.accumulated_text[user_id] = ""  # Start accumulation
-            await message.answer(t(lang, "style_prompt"))
-            return
-        await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-        reply = self._get_writer_bot(user_id).analyze_style(text)
-        self.user_states[user_id] = "chat"
-        await message.answer(reply)
-
-    async def _handle_roast(self, message: types.Message):
-        user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        state = self.user_states.get(user_id, "chat")
-        
-        # Check if we have document text waiting
-        if state == "document_wait":
-            text = self.accumulated_text.get(user_id, "")
-            if len(text) < 50:
-                await message.answer(t(lang, "text_too_short", min=50))
-                return
-            await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-            reply = self._get_writer_bot(user_id).roast(text)
-            self.user_states[user_id] = "chat"
-            del self.accumulated_text[user_id]
-            await message.answer(reply)
-            return
-        
-        text = (message.text or "").strip().replace("/roast", "").strip()
-        if len(text) < 50:
-            self.user_states[user_id] = "roast"
-            self.accumulated_text[user_id] = ""  # Start accumulation
-            await message.answer(t(lang, "roast_prompt"))
-            return
-        await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-        reply = self._get_writer_bot(user_id).roast(text)
-        self.user_states[user_id] = "chat"
-        await message.answer(reply)
-
-    async def _handle_praise(self, message: types.Message):
-        user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        state = self.user_states.get(user_id, "chat")
-        
-        # Check if we have document text waiting
-        if state == "document_wait":
-            text = self.accumulated_text.get(user_id, "")
-            if len(text) < 50:
-                await message.answer(t(lang, "text_too_short", min=50))
-                return
-            await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-            reply = self._get_writer_bot(user_id).praise(text)
-            self.user_states[user_id] = "chat"
-            del self.accumulated_text[user_id]
-            await message.answer(reply)
-            return
-        
-        text = (message.text or "").strip().replace("/praise", "").strip()
-        if len(text) < 50:
-            self.user_states[user_id] = "praise"
-            self.accumulated_text[user_id] = ""  # Start accumulation
-            await message.answer(t(lang, "praise_prompt"))
-            return
-        await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-        reply = self._get_writer_bot(user_id).praise(text)
-        self.user_states[user_id] = "chat"
+        user = self.users[user_id]
+        if user.state != "document_wait":
+            return False
+        text = user.accumulated_text or ""
+        if len(text) < min_len:
+            await message.answer(_t(self._lang_of(user_id), "text_too_short", min=min_len))
+            return True
+        reply = await self._run_cached(message.chat.id, user_id, method, text)
+        user.state = "chat"
+        user.accumulated_text = None
         await message.answer(reply)
+        return True
 
-    async def _handle_corrector(self, message: types.Message):
-        user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        state = self.user_states.get(user_id, "chat")
-        
-        # Check if we have document text waiting
-        if state == "document_wait":
-            text = self.accumulated_text.get(user_id, "")
-            if len(text) < 3:
-                await message.answer(t(lang, "text_too_short", min=3))
-                return
-            await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-            reply = self._get_writer_bot(user_id).correct_text(text)
-            self.user_states[user_id] = "chat"
-            del self.accumulated_text[user_id]
-            await message.answer(reply)
+    async def _handle_text_cmd(self, message: types.Message, text: str, cmd: str):
+        """Text-analysis commands (/feedback, /style, /roast, ...): run on the argument
+        or an uploaded document, or start collecting text until /done."""
+        wait_state = self.TEXT_COMMANDS[cmd]
+        min_len, method = self.STATE_CONFIG[wait_state]
+        if await self._run_on_document(message, min_len, method):
             return
         
-        text = (message.text or "").strip().replace("/corrector", "").strip()
-        if len(text) < 3:
-            self.user_states[user_id] = "corrector_wait"
-            self.accumulated_text[user_id] = ""  # Start accumulation
-            await message.answer(t(lang, "corrector_prompt"))
-            return
-        await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-        reply = self._get_writer_bot(user_id).correct_text(text)
-        self.user_states[user_id] = "chat"
-        await message.answer(reply)
-
-    async def _handle_editor(self, message: types.Message):
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        state = self.user_states.get(user_id, "chat")
-        
-        # Check if we have document text waiting
-        if state == "document_wait":
-            text = self.accumulated_text.get(user_id, "")
-            if len(text) < 5:
-                await message.answer(t(lang, "text_too_short", min=5))
-                return
-            await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-            reply = self._get_writer_bot(user_id).edit_text(text)
-            self.user_states[user_id] = "chat"
-            del self.accumulated_text[user_id]
-            await message.answer(reply)
+        user = self.users[user_id]
+        if len(text) < min_len:
+            user.state = wait_state
+            user.accumulated_text = ""  # Start accumulation
+            await message.answer(t(self._lang_of(user_id), f"{cmd}_prompt"))
             return
         
-        text = (message.text or "").strip().replace("/editor", "").strip()
-        if len(text) < 5:
-            self.user_states[user_id] = "editor_wait"
-            self.accumulated_text[user_id] = ""  # Start accumulation
-            await message.answer(t(lang, "editor_prompt"))
-            return
-        await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-        reply = self._get_writer_bot(user_id).edit_text(text)
-        self.user_states[user_id] = "chat"
+        reply = await self._run_cached(message.chat.id, user_id, method, text)
+        user.state = "chat"
         await message.answer(reply)
 
-    async def _handle_count_me(self, message: types.Message):
+    async def _handle_count_me(self, message: types.Message, text: str):
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        state = self.user_states.get(user_id, "chat")
+        lang = self._lang_of(user_id)
+        state = self.users[user_id].state
         
         # Check if we have document text waiting
         if state == "document_wait":
-            text = self.accumulated_text.get(user_id, "")
+            text = self.users[user_id].accumulated_text or ""
             if not text:
                 await message.answer(t(lang, "no_text_accumulated"))
                 return
@@ -904,27 +924,26 @@ class TelegramWriterBot:
             chars = count_chars(text)
             add_word_count(user_id, words, chars)
             s = get_stats(user_id)
-            self.user_states[user_id] = "chat"
-            del self.accumulated_text[user_id]
+            self.users[user_id].state = "chat"
+            self.users[user_id].accumulated_text = None
             await message.answer(t(lang, "count_me_done", count=words, chars=chars, today=s["today"], week=s["week"], month=s["month"], total=s["total"], chars_today=s["chars_today"], chars_week=s["chars_week"], chars_month=s["chars_month"], chars_total=s["chars_total"]))
             return
         
-        text = (message.text or "").strip().replace("/count_me", "").strip()
         if not text:
-            self.user_states[user_id] = "count_me_wait"
-            self.accumulated_text[user_id] = ""  # Start accumulation
+            self.users[user_id].state = "count_me_wait"
+            self.users[user_id].accumulated_text = ""  # Start accumulation
             await message.answer(t(lang, "count_me_prompt"))
             return
         words = count_words(text)
         chars = count_chars(text)
         add_word_count(user_id, words, chars)
         s = get_stats(user_id)
-        self.user_states[user_id] = "chat"
+        self.users[user_id].state = "chat"
         await message.answer(t(lang, "count_me_done", count=words, chars=chars, today=s["today"], week=s["week"], month=s["month"], total=s["total"], chars_today=s["chars_today"], chars_week=s["chars_week"], chars_month=s["chars_month"], chars_total=s["chars_total"]))
 
     async def _handle_stats(self, message: types.Message):
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
+        lang = self._lang_of(user_id)
         s = get_stats(user_id)
         await message.answer(t(lang, "stats_format", 
             today=s["today"], week=s["week"], month=s["month"], total=s["total"],
@@ -932,9 +951,9 @@ class TelegramWriterBot:
 
     async def _handle_lobster(self, message: types.Message):
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
+        lang = self._lang_of(user_id)
         await message.answer(t(lang, "lobster_typing"))
-        chunks = self._get_writer_bot(user_id).lobster()
+        chunks = await self._run_wb(user_id, self._get_writer_bot(user_id).lobster)
         
         # Check if lobster returned valid chunks
         if not chunks:
@@ -943,25 +962,26 @@ class TelegramWriterBot:
             await message.answer(fallback)
             return
         
-        for chunk in chunks:
-            if chunk and chunk.strip():  # Skip empty chunks
-                await message.answer(chunk)
-                await asyncio.sleep(0.8)
+        self._start_sending_chunks(
+            message.chat.id,
+            chunks,
+            message_thread_id=message.message_thread_id if message.is_topic_message else None,
+        )
 
     async def _handle_pun(self, message: types.Message):
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        last = self.last_user_message.get(user_id, "").strip()
+        lang = self._lang_of(user_id)
+        last = self.users[user_id].last_message.strip()
         if not last or last.startswith("/"):
             await message.answer(t(lang, "pun_no_message"))
             return
-        reply = self._get_writer_bot(user_id).pun(last)
+        reply = await self._run_wb(user_id, self._get_writer_bot(user_id).pun, last)
         await message.answer(reply)
 
     async def _handle_porko(self, message: types.Message):
         user_id = message.from_user.id
         wb = self._get_writer_bot(user_id)
-        reply = wb.porko()
+        reply = await self._run_wb(user_id, wb.porko)
         await message.answer(reply)
 
     def _should_respond_in_group(self, message: types.Message) -> tuple[bool, str]:
@@ -972,12 +992,18 @@ class TelegramWriterBot:
         if text.startswith("/"):
             return True, text
             
-        # Check if bot is mentioned
+        # Check if bot is mentioned: usually right at the start ("@bot ...")
+        bot_mention = self.bot_mention
+        if bot_mention and text[:len(bot_mention)].lower() == bot_mention:
+            rest = text[len(bot_mention):]
+            # Not a longer username that merely starts with ours
+            if not rest or not (rest[0].isalnum() or rest[0] == "_"):
+                return True, rest.strip()
         if message.entities:
             for entity in message.entities:
                 if entity.type == "mention":
                     mention = text[entity.offset:entity.offset + entity.length]
-                    if self.bot_username and mention.lower() == f"@{self.bot_username.lower()}":
+                    if self.bot_mention and mention.lower() == self.bot_mention:
                         # Remove mention from text
                         clean_text = text[:entity.offset] + text[entity.offset + entity.length:]
                         return True, clean_text.strip()
@@ -995,7 +1021,30 @@ class TelegramWriterBot:
 
     def _track_chat_for_auto_activation(self, chat_id: int):
         """Track group chat activity for auto-activation."""
-        self.last_auto_activation[chat_id] = datetime.now()
+        self.last_auto_activation[chat_id] = time.monotonic()
+
+    async def _send_broadcast_message(self, user_id: int, text: str) -> bool:
+        """Send one HTML broadcast message under the global rate limit; True if it was delivered.
+
+        Users who blocked the bot are dropped from the saved prefs so later broadcasts skip them.
+        """
+        try:
+            await self.broadcast_limiter.wait()
+            try:
+                await self.bot.send_message(user_id, text, parse_mode="HTML")
+            except TelegramRetryAfter as e:
+                # Flood limit hit: wait as told, then retry once
+                await asyncio.sleep(e.retry_after)
+                await self.bot.send_message(user_id, text, parse_mode="HTML")
+        except TelegramForbiddenError:
+            # Drop their saved language too, or _load_user_prefs would re-add them from user_langs
+            self.all_users.discard(user_id)
+            self.user_langs.pop(user_id, None)
+            self._save_user_prefs()
+            return False
+        except Exception:
+            return False
+        return True
 
     async def _process_update_broadcast(self):
         """Process pending update changelog broadcast to all users."""
@@ -1003,24 +1052,25 @@ class TelegramWriterBot:
             return
 
         changelog = self.pending_changelog
-        sent_count = 0
-        failed_count = 0
+        text = f"<b>Обновление бота</b>\n\n{changelog}"
+        # Same "quote soon" time for everyone, computed once
+        cite_soon_time = datetime.now() - timedelta(hours=23)
+        sem = asyncio.Semaphore(self.BROADCAST_CONCURRENCY)
+        
+        async def send_update(user_id: int) -> bool:
+            async with sem:
+                if not await self._send_broadcast_message(user_id, text):
+                    return False
+
+            # Включаем ежедневные цитаты для всех пользователей после обновления
+            user = self.users[user_id]
+            user.cite_enabled = True
+            user.cite_last_time = cite_soon_time  # Отправит цитату скоро
+            return True
         
-        for user_id in list(self.all_users):
-            try:
-                await self.bot.send_message(
-                    user_id,
-                    f"<b>Обновление бота</b>\n\n{changelog}",
-                    parse_mode="HTML"
-                )
-
-                # Включаем ежедневные цитаты для всех пользователей после обновления
-                self.user_cite_enabled[user_id] = True
-                self.user_cite_last_time[user_id] = datetime.now() - timedelta(hours=23)  # Отправит цитату скоро
-                
-                sent_count += 1
-            except Exception:
-                failed_count += 1
+        results = await asyncio.gather(*(send_update(user_id) for user_id in list(self.all_users)))
+        sent_count = sum(results)
+        failed_count = len(results) - sent_count
         
         # Сохраняем настройки пользователей
         self._save_user_prefs()
@@ -1034,17 +1084,17 @@ class TelegramWriterBot:
     async def _handle_upload_cmd(self, message: types.Message):
         """Handle /upload command - prompt user to send a file."""
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        self.user_states[user_id] = "upload_wait"
+        lang = self._lang_of(user_id)
+        self.users[user_id].state = "upload_wait"
         await message.answer(t(lang, "upload_prompt"))
 
     async def _handle_document(self, message: types.Message):
         """Handle document uploads (.txt, .docx, .pdf) with DDoS protection."""
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
+        lang = self._lang_of(user_id)
         
         # Check if user is in upload_wait state or just sent file directly
-        state = self.user_states.get(user_id, "chat")
+        state = self.users[user_id].state
         
         # DDoS protection limits - increased for novels
         MAX_FILE_SIZE_MB = 20  # Max 20MB for novels
@@ -1060,8 +1110,8 @@ class TelegramWriterBot:
         file_size = doc.file_size or 0
         
         # Check file extension
-        allowed_extensions = (".txt", ".docx", ".pdf")
-        if not any(file_name.lower().endswith(ext) for ext in allowed_extensions):
+        ext = os.path.splitext(file_name)[1].lower()
+        if ext not in (".txt", ".docx", ".pdf"):
             return  # Silently ignore non-supported documents
         
         # Check file size (5MB limit)
@@ -1070,14 +1120,14 @@ class TelegramWriterBot:
             return
         
         # Check if user is in cooldown (additional DDoS protection)
-        now = datetime.now()
-        if user_id in self.user_error_cooldown:
-            if now < self.user_error_cooldown[user_id]:
-                await message.answer(t(lang, "error_cooldown", seconds=int((self.user_error_cooldown[user_id] - now).total_seconds())))
-                return
+        now = time.monotonic()
+        cooldown = self.users[user_id].error_cooldown
+        if cooldown is not None and now < cooldown:
+            await message.answer(t(lang, "error_cooldown", seconds=int(cooldown - now)))
+            return
         
         # Download and process file
-        await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
+        self._start_typing(message.chat.id)
         
         try:
             # Download file to temporary location
@@ -1085,29 +1135,28 @@ class TelegramWriterBot:
             file_path = file_info.file_path
             
             # Create temp file
-            suffix = Path(file_name).suffix
-            with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp_file:
+            with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp_file:
                 tmp_path = tmp_file.name
             
             # Download
             await self.bot.download_file(file_path, tmp_path)
             
-            # Extract text based on file type
+            # Extract text based on file type (parsing runs in a worker thread, off the event loop)
             extracted_text = ""
-            if file_name.lower().endswith(".txt"):
-                extracted_text = await self._extract_txt(tmp_path, MAX_CHARS_TXT)
-            elif file_name.lower().endswith(".docx"):
+            if ext == ".txt":
+                extracted_text = await asyncio.to_thread(self._extract_txt, tmp_path, MAX_CHARS_TXT)
+            elif ext == ".docx":
                 if not DOCX_AVAILABLE:
                     await message.answer(t(lang, "docx_not_available"))
                     os.unlink(tmp_path)
                     return
-                extracted_text = await self._extract_docx(tmp_path, MAX_CHARS_DOCX)
-            elif file_name.lower().endswith(".pdf"):
+                extracted_text = await asyncio.to_thread(self._extract_docx, tmp_path, MAX_CHARS_DOCX)
+            elif ext == ".pdf":
                 if not PYPDF_AVAILABLE:
                     await message.answer(t(lang, "pdf_not_available"))
                     os.unlink(tmp_path)
                     return
-                extracted_text = await self._extract_pdf(tmp_path, MAX_PAGES_PDF, MAX_CHARS_TXT)
+                extracted_text = await asyncio.to_thread(self._extract_pdf, tmp_path, MAX_PAGES_PDF, MAX_CHARS_TXT)
 
             
             # Clean up temp file
@@ -1123,8 +1172,8 @@ class TelegramWriterBot:
                 return
             
             # Store extracted text and set state for processing
-            self.accumulated_text[user_id] = extracted_text
-            self.user_states[user_id] = "document_wait"
+            self.users[user_id].accumulated_text = extracted_text
+            self.users[user_id].state = "document_wait"
             
             # Ask user what to do with the text
             preview = extracted_text[:200] + "..." if len(extracted_text) > 200 else extracted_text
@@ -1136,10 +1185,10 @@ class TelegramWriterBot:
             )
             
         except Exception as e:
-            print(f"Document processing error: {e}")
+            logger.error("Document processing error: %s", e)
             await message.answer(t(lang, "document_error"))
 
-    async def _extract_txt(self, file_path: str, max_chars: int) -> str:
+    def _extract_txt(self, file_path: str, max_chars: int) -> str:
         """Extract text from TXT file."""
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
@@ -1149,112 +1198,109 @@ class TelegramWriterBot:
             with open(file_path, 'r', encoding='latin-1') as f:
                 return f.read(max_chars)
 
-    async def _extract_docx(self, file_path: str, max_chars: int) -> str:
+    def _extract_docx(self, file_path: str, max_chars: int) -> str:
         """Extract text from DOCX file."""
         doc = Document(file_path)
-        text_parts = []
+        buf = io.StringIO()
         total_chars = 0
         
-        for para in doc.paragraphs:
+        for i, para in enumerate(doc.paragraphs):
             text = para.text
-            if total_chars + len(text) > max_chars:
-                text_parts.append(text[:max_chars - total_chars])
+            if i:
+                if total_chars + 1 >= max_chars:
+                    break
+                buf.write("\n")
+                total_chars += 1
+            remaining = max_chars - total_chars
+            if len(text) >= remaining:
+                buf.write(text[:remaining])
                 break
-            text_parts.append(text)
-            total_chars += len(text) + 1  # +1 for newline
+            buf.write(text)
+            total_chars += len(text)
         
-        return "\n".join(text_parts)
+        return buf.getvalue()
 
-    async def _extract_pdf(self, file_path: str, max_pages: int, max_chars: int) -> str:
+    def _extract_pdf(self, file_path: str, max_pages: int, max_chars: int) -> str:
         """Extract text from PDF file using pypdf."""
         reader = PdfReader(file_path)
-        text_parts = []
+        buf = io.StringIO()
         total_chars = 0
         
         for i, page in enumerate(reader.pages):
             if i >= max_pages:
                 break
             text = page.extract_text() or ""
-            if total_chars + len(text) > max_chars:
-                text_parts.append(text[:max_chars - total_chars])
+            if i:
+                if total_chars + 2 >= max_chars:
+                    break
+                buf.write("\n\n")
+                total_chars += 2
+            remaining = max_chars - total_chars
+            if len(text) >= remaining:
+                buf.write(text[:remaining])
                 break
-            text_parts.append(text)
+            buf.write(text)
             total_chars += len(text)
         
-        return "\n\n".join(text_parts)
+        return buf.getvalue()
 
 
-    async def _handle_methodique(self, message: types.Message):
-        user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        state = self.user_states.get(user_id, "chat")
-        
+    async def _handle_methodique(self, message: types.Message, text: str):
         # Check if we have document text waiting
-        if state == "document_wait":
-            text = self.accumulated_text.get(user_id, "")
-            if len(text) < 5:
-                await message.answer(t(lang, "text_too_short", min=5))
-                return
-            await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-            reply = self._get_writer_bot(user_id).methodique(text)
-            self.user_states[user_id] = "chat"
-            del self.accumulated_text[user_id]
-            await message.answer(reply)
+        if await self._run_on_document(message, *self.STATE_CONFIG["methodique_wait"]):
             return
-        
-        text = (message.text or "").strip()
-        # Remove both /methodique and /methodichque
-        text = text.replace("/methodique", "").replace("/methodichque", "").strip()
+        user_id = message.from_user.id
+        lang = self._lang_of(user_id)
         
         # Check if user just sent "Методичка" or "Methodic" (trigger word for random insights)
         if text in ("Методичка", "Methodic"):
-            await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
             wb = self._get_writer_bot(user_id)
-            reply = wb.methodique_random()
+            reply = await self._run_with_typing(message.chat.id, user_id, wb.methodique_random)
             await message.answer(reply)
             return
         
         if len(text) < 5:
-            self.user_states[user_id] = "methodique_wait"
-            self.accumulated_text[user_id] = ""  # Start accumulation
+            self.users[user_id].state = "methodique_wait"
+            self.users[user_id].accumulated_text = ""  # Start accumulation
             await message.answer(t(lang, "methodichque_prompt"))
             return
-        await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-        reply = self._get_writer_bot(user_id).methodique(text)
-        self.user_states[user_id] = "chat"
+        reply = await self._run_cached(message.chat.id, user_id, "methodique", text)
+        self.users[user_id].state = "chat"
         await message.answer(reply)
 
     async def _handle_cite(self, message: types.Message):
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        quote, writer = self._get_writer_bot(user_id).cite()
+        lang = self._lang_of(user_id)
+        quote, writer = await self._run_wb(user_id, self._get_writer_bot(user_id).cite)
         await message.answer(t(lang, "cite_format", quote=quote, writer=writer))
 
     async def _handle_cite_off(self, message: types.Message):
         user_id = message.from_user.id
-        self.user_cite_enabled[user_id] = False
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
+        self.users[user_id].cite_enabled = False
+        lang = self._lang_of(user_id)
         msg = "Daily quotes disabled. Use /cite_on to enable back." if lang == "en" else "Ежедневные цитаты отключены. Используйте /cite_on, чтобы включить обратно."
         await message.answer(msg)
 
     async def _handle_cite_on(self, message: types.Message):
         user_id = message.from_user.id
-        self.user_cite_enabled[user_id] = True
-        self.user_cite_last_time[user_id] = datetime.now()
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
+        user = self.users[user_id]
+        user.cite_enabled = True
+        user.cite_last_time = datetime.now()
+        lang = self._lang_of(user_id)
         msg = "Daily quotes enabled." if lang == "en" else "Ежедневные цитаты включены."
         await message.answer(msg)
 
     async def _handle_cite_when(self, message: types.Message):
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
+        lang = self._lang_of(user_id)
+        user = self.users[user_id]
         
-        if not self.user_cite_enabled.get(user_id, False):
+        if not user.cite_enabled:
             msg = "Daily quotes are disabled. Use /cite_on to enable." if lang == "en" else "Ежедневные цитаты отключены. Используйте /cite_on, чтобы включить."
             await message.answer(msg)
             return
 
-        last_time = self.user_cite_last_time.get(user_id)
+        last_time = user.cite_last_time
         if not last_time:
             msg = "Next quote will arrive soon." if lang == "en" else "Следующая цитата придет скоро."
             await message.answer(msg)
@@ -1278,81 +1324,57 @@ class TelegramWriterBot:
 
     async def _handle_summary(self, message: types.Message):
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        state = self.user_states.get(user_id, "chat")
-        full_text = (self.accumulated_text.get(user_id) or "").strip()
+        lang = self._lang_of(user_id)
+        state = self.users[user_id].state
+        full_text = (self.users[user_id].accumulated_text or "").strip()
 
         # Сразу выбор формата — ТОЛЬКО если текст пришёл из файла (document_wait)
         if state == "document_wait" and full_text:
-            self.user_states[user_id] = self.SUMMARY_FORMAT_STATE
-
-            builder = ReplyKeyboardBuilder()
-            builder.add(KeyboardButton(text=t(lang, "btn_summary_sentence")))
-            builder.add(KeyboardButton(text=t(lang, "btn_summary_paragraph")))
-            builder.add(KeyboardButton(text=t(lang, "btn_summary_two_paragraphs")))
-            builder.add(KeyboardButton(text=t(lang, "btn_summary_detailed")))
-            builder.adjust(2)
+            self.users[user_id].state = self.SUMMARY_FORMAT_STATE
 
             await message.answer(
                 t(lang, "summary_choose_format"),
-                reply_markup=builder.as_markup(resize_keyboard=True)
+                reply_markup=get_summary_keyboard(lang, 2)
             )
             return
 
         # Иначе обычный режим — начинаем накопление с чистого листа
-        self.accumulated_text[user_id] = ""
-        self.user_states[user_id] = "summary_wait"
+        self.users[user_id].accumulated_text = ""
+        self.users[user_id].state = "summary_wait"
 
         await message.answer(t(lang, "summary_prompt"))
 
 
     
-    async def _handle_summary_choice(self, message: types.Message, text: str):
+    async def _handle_summary_choice(self, message: types.Message, instr_key: str):
+        """Summarize the accumulated text in the chosen format; False if not choosing a format."""
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        state = self.user_states.get(user_id, "chat")
+        lang = self._lang_of(user_id)
+        state = self.users[user_id].state
 
         # Выбор формата разрешаем только когда мы реально в режиме выбора формата
         if state != self.SUMMARY_FORMAT_STATE:
             return False
 
-        # Поддержка RU и EN независимо от текущего lang
-
-        format_map = {
-            t("ru", "btn_summary_sentence"): "instr_summary_one_sentence",
-            t("ru", "btn_summary_paragraph"): "instr_summary_one_paragraph",
-            t("ru", "btn_summary_two_paragraphs"): "instr_summary_two_paragraphs",
-            t("ru", "btn_summary_detailed"): "instr_summary_detailed_full",
-            t("en", "btn_summary_sentence"): "instr_summary_one_sentence",
-            t("en", "btn_summary_paragraph"): "instr_summary_one_paragraph",
-            t("en", "btn_summary_two_paragraphs"): "instr_summary_two_paragraphs",
-            t("en", "btn_summary_detailed"): "instr_summary_detailed_full",
-        }
-
-
-        instr_key = format_map.get(text)
-        if not instr_key:
-            return False
-
-        full_text = self.accumulated_text.get(user_id, "")
+        full_text = self.users[user_id].accumulated_text or ""
         if not full_text:
             await message.answer(t(lang, "no_text_accumulated"),
                              reply_markup=get_main_keyboard(lang))
-            self.user_states[user_id] = "chat"
+            self.users[user_id].state = "chat"
             return True
 
-        await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
-
-        wb = self._get_writer_bot(user_id)
         instr = t(lang, instr_key)
 
-        response = wb.generate_response(
+        response = await self._run_cached(
+            message.chat.id,
+            user_id,
+            "generate_response",
             full_text,
             temporary_system_instruction=instr
         )
 
         # Transition to discussion mode for summary
-        self.user_states[user_id] = "summary_discuss"
+        self.users[user_id].state = "summary_discuss"
         # Keep accumulated_text for context in discussion
         
         await message.answer(response + f"\n\n{t(lang, 'discuss_mode_hint')}", reply_markup=get_main_keyboard(lang), parse_mode=None)
@@ -1363,18 +1385,19 @@ class TelegramWriterBot:
 
     async def _check_and_send_daily_cite(self, user_id: int, chat_id: int):
         """Check if it's time to send a daily quote and send it."""
-        if not self.user_cite_enabled.get(user_id, False):
+        user = self.users[user_id]
+        if not user.cite_enabled:
             return
         
         # Check for inactivity - auto-disable after 17 days
         now = datetime.now()
-        last_activity = self.user_last_activity.get(user_id)
+        last_activity = user.last_activity
         if last_activity:
             days_inactive = (now - last_activity).days
             if days_inactive >= self.AUTO_DISABLE_DAYS:
                 # Auto-disable due to inactivity
-                self.user_cite_enabled[user_id] = False
-                lang = self.user_langs.get(user_id, DEFAULT_LANG)
+                user.cite_enabled = False
+                lang = self._lang_of(user_id)
                 msg = (
                     "Daily quotes auto-disabled due to 17+ days of inactivity. "
                     "Use /cite_on to re-enable."
@@ -1385,35 +1408,33 @@ class TelegramWriterBot:
                 await self.bot.send_message(chat_id=chat_id, text=msg)
                 return
 
-        now = datetime.now()
-        last_time = self.user_cite_last_time.get(user_id)
+        last_time = user.cite_last_time
         
         # If never sent or more than 24h passed
         if not last_time or (now - last_time) >= timedelta(hours=24):
-            lang = self.user_langs.get(user_id, DEFAULT_LANG)
+            lang = self._lang_of(user_id)
             wb = self._get_writer_bot(user_id)
             
             # Get all available quotes for this language to manage history
             # We need to peek into writer_bot's logic or just use its cite() and track history here
             # Since cite() is random, we'll try a few times to get a new one or just accept it
             
-            quote, writer = wb.cite()
-            history = self.user_cite_history.get(user_id, [])
+            quote, writer = await self._run_wb(user_id, wb.cite)
+            history, seen = user.cite_history, user.cite_seen
             
             # Simple deduplication: if quote in history, try one more time
-            if quote in history:
-                quote, writer = wb.cite()
+            if quote in seen:
+                quote, writer = await self._run_wb(user_id, wb.cite)
             
-            # Update history
-            history.append(quote)
-            # If history gets too large (e.g. > 150), clear it to avoid memory issues
-            # and allow repeats after a long cycle.
-            if len(history) > 150: 
-                history = [quote]
+            # Update history: keep the last CITE_HISTORY_SIZE quotes, so old ones can repeat
+            if quote not in seen:
+                if len(history) == history.maxlen:
+                    seen.discard(history[0])
+                history.append(quote)
+                seen.add(quote)
             
-            self.user_cite_history[user_id] = history
-            self.user_cite_last_time[user_id] = now
-            self.user_cite_count[user_id] = self.user_cite_count.get(user_id, 0) + 1
+            user.cite_last_time = now
+            user.cite_count += 1
             
             await self.bot.send_message(
                 chat_id, 
@@ -1421,7 +1442,7 @@ class TelegramWriterBot:
             )
             
             # Send /cite_off hint on 2nd, 7th, 12th... time
-            count = self.user_cite_count[user_id]
+            count = user.cite_count
             if count == 2 or (count > 2 and (count - 2) % 5 == 0):
                 hint = (
                     "You can disable daily quotes with /cite_off" 
@@ -1432,8 +1453,8 @@ class TelegramWriterBot:
 
     async def _handle_cry_baby(self, message: types.Message):
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        self.user_states[user_id] = "cry_baby"
+        lang = self._lang_of(user_id)
+        self.users[user_id].state = "cry_baby"
         await message.answer(t(lang, "cry_baby_offer"))
 
     async def _handle_confo_toggle(self, message: types.Message):
@@ -1441,7 +1462,7 @@ class TelegramWriterBot:
         user_id = message.from_user.id
         
         # Only allow admin to use this command
-        if user_id != ADMIN_ID:
+        if user_id != self.admin_id:
             return
         
         # Toggle confo mode (this is an internal feature)
@@ -1461,14 +1482,14 @@ class TelegramWriterBot:
         """Handle /debug command - show environment info (admin only)."""
         user_id = message.from_user.id
         
-        if user_id != ADMIN_ID:
+        if user_id != self.admin_id:
             return  # Silently ignore non-admins
         
         # Show current environment status
         debug_info = (
             f"<b>Debug Info</b>\n\n"
-            f"ADMIN_ID: <code>{ADMIN_ID}</code>\n"
-            f"DEFAULT_LANG: <code>{DEFAULT_LANG}</code>\n"
+            f"ADMIN_ID: <code>{self.admin_id}</code>\n"
+            f"DEFAULT_LANG: <code>{self.default_lang}</code>\n"
             f"Loaded .env: {getattr(self, '_env_loaded_path', 'unknown')}\n\n"
             f"Bot username: @{self.bot_username or 'unknown'}\n"
             f"Bot user ID: <code>{self.bot_user_id or 'unknown'}</code>\n"
@@ -1481,7 +1502,7 @@ class TelegramWriterBot:
         """Handle /admin <message> — mass broadcast from admin."""
         admin_id = message.from_user.id
 
-        if admin_id != ADMIN_ID:
+        if admin_id != self.admin_id:
             return  # Silently ignore non-admins
 
 
@@ -1517,36 +1538,73 @@ class TelegramWriterBot:
         await message.answer(preview, parse_mode="HTML")
 
         # Wait for confirmation (simple implementation via state)
-        self.user_states[admin_id] = f"admin_confirm:{broadcast_text}"
+        self.users[admin_id].state = "admin_confirm"
+        self.users[admin_id].pending_broadcast = broadcast_text
     
     async def _process_admin_broadcast(self, message: types.Message, broadcast_text: str):
         """Execute broadcast after confirmation."""
         admin_id = message.from_user.id
         
         # Reset state
-        self.user_states[admin_id] = "chat"
+        self.users[admin_id].state = "chat"
 
         
         # Statistics
         sent_count = 0
-        failed_count = 0
-        failed_users = []
+        failed_users = array("q")  # user IDs, stringified only for the report
+        
+        # Snapshot: blocked users are removed from all_users while we send
+        recipients = tuple(self.all_users)
+        total = len(recipients)
+        text = f"<b>Message from administrator</b>\n\n{broadcast_text}"
         
         # Send status message
-        status_msg = await message.answer(f"Starting broadcast to {len(self.all_users)} users...")
+        status_msg = await message.answer(f"Starting broadcast to {total} users...")
+        
+        # Producer/consumer: BROADCAST_CONCURRENCY workers pull IDs from a bounded queue
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1024)
+        
+        async def produce():
+            for user_id in recipients:
+                await queue.put(user_id)
+            for _ in range(self.BROADCAST_CONCURRENCY):
+                await queue.put(None)
+        
+        async def work():
+            nonlocal sent_count
+            while (user_id := await queue.get()) is not None:
+                if await self._send_broadcast_message(user_id, text):
+                    sent_count += 1
+                else:
+                    failed_users.append(user_id)
+        
+        async def report_progress():
+            # One edit per interval however many sends completed, so edits don't eat the send budget
+            shown = None
+            while True:
+                await asyncio.sleep(self.BROADCAST_PROGRESS_SECONDS)
+                progress = (sent_count, len(failed_users))
+                if progress == shown:
+                    continue
+                shown = progress
+                try:
+                    await status_msg.edit_text(f"Sent {progress[0]}/{total}, failed {progress[1]}")
+                except TelegramBadRequest:
+                    pass  # e.g. "message is not modified"
+                except TelegramRetryAfter as e:
+                    shown = None  # edit again after the wait
+                    await asyncio.sleep(e.retry_after)
+                except Exception as e:
+                    shown = None
+                    logger.warning("Broadcast progress update failed: %s", e)
         
-        # Broadcast to all users
-        for user_id in list(self.all_users):
-            try:
-                await self.bot.send_message(
-                    user_id,
-                    f"<b>Message from administrator</b>\n\n{broadcast_text}",
-                    parse_mode="HTML"
-                )
-                sent_count += 1
-            except Exception:
-                failed_count += 1
-                failed_users.append(str(user_id))
+        progress_task = asyncio.create_task(report_progress())
+        try:
+            await asyncio.gather(produce(), *(work() for _ in range(self.BROADCAST_CONCURRENCY)))
+        finally:
+            progress_task.cancel()
+            await asyncio.gather(progress_task, return_exceptions=True)
+        failed_count = len(failed_users)
         
         # Build report
         report_lines = [
@@ -1558,40 +1616,35 @@ class TelegramWriterBot:
         
         if failed_count > 0:
             report_lines.append(f"")
-            report_lines.append(f"Failed to send to: {', '.join(failed_users[:10])}")
+            report_lines.append(f"Failed to send to: {', '.join(map(str, failed_users[:10]))}")
             if len(failed_users) > 10:
                 report_lines.append(f"... and {len(failed_users) - 10} more")
         
         await status_msg.edit_text("\n".join(report_lines), parse_mode="HTML")
 
-    async def _handle_dev_feedback(self, message: types.Message):
+    async def _handle_dev_feedback(self, message: types.Message, text: str):
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
+        lang = self._lang_of(user_id)
         
         # ADMIN_ID must be configured, otherwise dev feedback will always crash/throw.
-        if ADMIN_ID <= 0:
+        if self.admin_id <= 0:
             await message.answer(
                 "Dev feedback is not configured (ADMIN_ID is missing in .env)."
                 if lang == "en" else
                 "dev_feedback не настроен: в .env не задан ADMIN_ID (ID разработчика)."
             )
-            self.user_states[user_id] = "chat"
-            if user_id in self.accumulated_text:
-                del self.accumulated_text[user_id]
+            self.users[user_id].state = "chat"
+            self.users[user_id].accumulated_text = None
             return
         
-        # Get text from message, handling both direct command and accumulated text
-        raw_text = (message.text or "").strip()
-        text = raw_text.replace("/dev_feedback", "").strip()
-        
         # Debug info
-        print(f"dev_feedback: user={user_id}, text_len={len(text)}, raw_len={len(raw_text)}")
-        print(f"dev_feedback: accumulated_text exists={user_id in self.accumulated_text}")
+        logger.debug("dev_feedback: user=%s, text_len=%d", user_id, len(text))
+        logger.debug("dev_feedback: accumulated_text exists=%s", self.users[user_id].accumulated_text is not None)
         
         if not text:
             # No text provided - start accumulation mode
-            self.user_states[user_id] = "dev_feedback_wait"
-            self.accumulated_text[user_id] = ""  # Start accumulation
+            self.users[user_id].state = "dev_feedback_wait"
+            self.users[user_id].accumulated_text = ""  # Start accumulation
             await message.answer(t(lang, "dev_feedback_prompt"))
             return
         
@@ -1599,15 +1652,14 @@ class TelegramWriterBot:
         try:
             user_info = f"@{message.from_user.username}" if message.from_user.username else f"ID:{user_id}"
             dev_msg = f"Dev feedback from {user_info}:\n\n{text}"
-            print(f"dev_feedback: sending to ADMIN_ID={ADMIN_ID}, msg_len={len(dev_msg)}")
-            await self.bot.send_message(chat_id=ADMIN_ID, text=dev_msg)
+            logger.debug("dev_feedback: sending to ADMIN_ID=%s, msg_len=%d", self.admin_id, len(dev_msg))
+            await self.bot.send_message(chat_id=self.admin_id, text=dev_msg)
             await message.answer(t(lang, "dev_feedback_thanks"))
         except Exception as e:
-            print(f"dev_feedback error: {e}")
+            logger.error("dev_feedback error: %s", e)
             await message.answer(t(lang, "error_llm"))
-        self.user_states[user_id] = "chat"
-        if user_id in self.accumulated_text:
-            del self.accumulated_text[user_id]
+        self.users[user_id].state = "chat"
+        self.users[user_id].accumulated_text = None
 
 
 
@@ -1618,21 +1670,17 @@ class TelegramWriterBot:
 
         user_id = message.from_user.id
         chat_id = message.chat.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
+        lang = self._lang_of(user_id)
         text = (message.text or "").strip()
         
         # Get state FIRST
-        state = self.user_states.get(user_id, "chat")
+        state = self.users[user_id].state
         
         # ===== SUMMARY BUTTONS CHECK (before accumulation) =====
         # Check for summary button presses first (before they get accumulated as text)
-        if text in (
-            t(lang, "btn_summary_sentence"),
-            t(lang, "btn_summary_paragraph"),
-            t(lang, "btn_summary_two_paragraphs"),
-            t(lang, "btn_summary_detailed")
-        ):
-            if await self._handle_summary_choice(message, text):
+        instr_key = SUMMARY_FORMATS.get(text)
+        if instr_key:
+            if await self._handle_summary_choice(message, instr_key):
                 return
         # ===== END SUMMARY BUTTONS CHECK =====
         
@@ -1648,13 +1696,13 @@ class TelegramWriterBot:
 
         if state in self.STATE_CONFIG:
             # Accumulate text
-            current_acc = self.accumulated_text.get(user_id, "")
+            current_acc = self.users[user_id].accumulated_text or ""
             if current_acc:
-                self.accumulated_text[user_id] = current_acc + "\n\n" + text
+                self.users[user_id].accumulated_text = current_acc + "\n\n" + text
             else:
-                self.accumulated_text[user_id] = text
+                self.users[user_id].accumulated_text = text
 
-            acc_len = len(self.accumulated_text[user_id])
+            acc_len = len(self.users[user_id].accumulated_text)
             
             # Summary НЕ показывает кнопки тут — только после /done
             await message.answer(t(lang, "text_accumulated", length=acc_len))
@@ -1666,15 +1714,16 @@ class TelegramWriterBot:
         # Check if user is in error cooldown
 
 
-        now = datetime.now()
-        if user_id in self.user_error_cooldown:
-            if now < self.user_error_cooldown[user_id]:
+        now = time.monotonic()
+        user = self.users[user_id]
+        if user.error_cooldown is not None:
+            if now < user.error_cooldown:
                 # Silently ignore messages during cooldown
                 return
             else:
                 # Cooldown expired, clear it
-                del self.user_error_cooldown[user_id]
-                self.user_error_count[user_id] = 0
+                user.error_cooldown = None
+                user.error_count = 0
         
         # Check if bot is waiting for user input (command continuation)
         is_waiting_input = state in self.WAITING_STATES
@@ -1695,18 +1744,18 @@ class TelegramWriterBot:
             return
 
         # Check for admin confirmation (manual /admin broadcast)
-        state = self.user_states.get(user_id, "chat")
-        if state.startswith("admin_confirm:"):
-            if text.strip().lower() in ("yes", "да", "y", "д"):
-                broadcast_text = state[14:]  # remove "admin_confirm:" prefix
+        state = user.state
+        if state == "admin_confirm":
+            broadcast_text, user.pending_broadcast = user.pending_broadcast, None
+            if broadcast_text and text.strip().lower() in ("yes", "да", "y", "д"):
                 await self._process_admin_broadcast(message, broadcast_text)
             else:
-                self.user_states[user_id] = "chat"
+                user.state = "chat"
                 await message.answer("❌ Broadcast cancelled")
             return
 
         # Check for admin confirmation (auto changelog broadcast)
-        if user_id == ADMIN_ID and state == "changelog_confirm":
+        if user_id == self.admin_id and state == "changelog_confirm":
             if text.strip().lower() in ("yes", "да", "y", "д"):
                 await message.answer("✅ Starting update broadcast...")
                 sent, failed = await self._process_update_broadcast()
@@ -1714,7 +1763,7 @@ class TelegramWriterBot:
             else:
                 await message.answer("❌ Update broadcast cancelled")
                 # Don't delete changelog automatically; let admin confirm later if needed
-            self.user_states[user_id] = "chat"
+            self.users[user_id].state = "chat"
             return
 
         # (old pending_update_changelogs flow removed; now uses pending_changelog + changelog_confirm)
@@ -1722,19 +1771,13 @@ class TelegramWriterBot:
 
         # Check for exact trigger word from keyboard
 
-        if text in (
-            t(lang, "button_methodique"),
-            t(lang, "button_prompt"),
-            t(lang, "button_idea"),
-            t(lang, "button_help"),
-        ):
-            await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
+        if text in _button_texts(lang, MAIN_BUTTON_KEYS):
             wb = self._get_writer_bot(user_id)
             
             if text in ("Методичка", "Methodic"):
-                reply = wb.methodique_random()
+                reply = await self._run_with_typing(message.chat.id, user_id, wb.methodique_random)
             elif text in ("Команды", "Commands"):
-                reply = t(lang, "help")
+                reply = _t(lang, "help")
             elif text in ("Промпт", "Prompt"):
                 await self._handle_prompt(message)
                 return
@@ -1748,15 +1791,15 @@ class TelegramWriterBot:
             return
 
         if text:
-            self.last_user_message[user_id] = text
+            user.last_message = text
         
         # Fallback: if bot was "away" for more than 1 hour (bot inactive, not user)
         # Check BEFORE updating the timestamp
-        if self.bot_last_activity and (now - self.bot_last_activity).total_seconds() > 3600:
+        if self.bot_last_activity and now - self.bot_last_activity > 3600:
             await message.answer(t(lang, "bot_returned"))
         
         # Show pending changelog to admin only for confirmation
-        if self.pending_changelog and user_id == ADMIN_ID:
+        if self.pending_changelog and user_id == self.admin_id:
             await message.answer(self.pending_changelog, parse_mode="HTML")
             # Clear changelog after showing to admin
             self.pending_changelog = None
@@ -1766,12 +1809,12 @@ class TelegramWriterBot:
 
         self.bot_last_activity = now
         
-        state = self.user_states.get(user_id, "chat")
+        state = self.users[user_id].state
 
         if state == "cry_baby":
 
-            self.user_states[user_id] = "chat"
-            reply = self._get_writer_bot(user_id).cry_baby_reply()
+            self.users[user_id].state = "chat"
+            reply = await self._run_wb(user_id, self._get_writer_bot(user_id).cry_baby_reply)
             await message.answer(reply)
             return
 
@@ -1787,7 +1830,7 @@ class TelegramWriterBot:
         
         if user_id not in self.user_langs and len(text) >= 5:
             try:
-                code, _ = detect_language(text)
+                code, _ = await asyncio.to_thread(detect_language, text)
                 if code == "ru":
                     self.user_langs[user_id] = "ru"
                 else:
@@ -1798,57 +1841,53 @@ class TelegramWriterBot:
             except Exception:
                 pass
 
-        await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
         wb = self._get_writer_bot(user_id)
         try:
-            response = wb.chat(text)
+            response = await self._run_with_typing(message.chat.id, user_id, wb.chat, text)
             if not response or response.startswith("Error"):
                 # Track error
-                self.user_error_count[user_id] = self.user_error_count.get(user_id, 0) + 1
-                if self.user_error_count[user_id] >= self.max_consecutive_errors:
-                    self.user_error_cooldown[user_id] = datetime.now() + timedelta(seconds=self.error_cooldown_seconds)
+                user.error_count += 1
+                if user.error_count >= self.max_consecutive_errors:
+                    user.error_cooldown = time.monotonic() + self.error_cooldown_seconds
                     await message.answer(t(lang, "error_cooldown", seconds=self.error_cooldown_seconds))
                     return
                 await message.answer(t(lang, "error_llm"))
                 return
         except Exception as e:
             # Track error
-            self.user_error_count[user_id] = self.user_error_count.get(user_id, 0) + 1
-            if self.user_error_count[user_id] >= self.max_consecutive_errors:
+            user.error_count += 1
+            if user.error_count >= self.max_consecutive_errors:
                 # Bot seems to be down - use longer cooldown and informative message
-                self.user_error_cooldown[user_id] = datetime.now() + timedelta(seconds=300)  # 5 min cooldown
+                user.error_cooldown = time.monotonic() + 300  # 5 min cooldown
                 await message.answer(t(lang, "bot_unavailable"))
                 return
             await message.answer(t(lang, "error_llm"))
             return
         
         # Success - reset error count
-        self.user_error_count[user_id] = 0
+        user.error_count = 0
         
-        if len(response) > 4000:
-            chunks = [response[i:i+4000] for i in range(0, len(response), 4000)]
-            for idx, chunk in enumerate(chunks):
-                if idx == len(chunks) - 1:
-                    await message.answer(chunk, reply_markup=get_main_keyboard(lang))
-                else:
-                    await message.answer(chunk)
-        else:
-            await message.answer(response, reply_markup=get_main_keyboard(lang))
+        # Send in 4000-char pieces, sliced one at a time (a short reply is sent as is:
+        # response[0:4000] is response itself); the keyboard goes with the last piece
+        last_start = (len(response) - 1) // 4000 * 4000
+        for start in range(0, len(response), 4000):
+            await message.answer(
+                response[start:start + 4000],
+                reply_markup=get_main_keyboard(lang) if start == last_start else None,
+            )
 
 
     async def _handle_discussion(self, message: types.Message, text: str, state: str):
         """Handle discussion mode - user discussing tool results with context."""
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
+        lang = self._lang_of(user_id)
         
         original_state, instr_key = self.DISCUSSION_STATES.get(state, (None, None))
         if not original_state:
             return
         
         # Get the original analyzed text for context
-        analyzed_text = self.accumulated_text.get(user_id, "")
-        
-        await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
+        analyzed_text = self.users[user_id].accumulated_text or ""
         
         try:
             wb = self._get_writer_bot(user_id)
@@ -1869,7 +1908,10 @@ class TelegramWriterBot:
                     f"Answer their question while maintaining the same perspective."
                 )
             
-            response = wb.generate_response(
+            response = await self._run_with_typing(
+                message.chat.id,
+                user_id,
+                wb.generate_response,
                 f"User question: {text}",
                 temporary_system_instruction=discussion_instr
             )
@@ -1877,21 +1919,20 @@ class TelegramWriterBot:
             await message.answer(response + f"\n\n{t(lang, 'discuss_mode_hint')}")
             
         except Exception as e:
-            print(f"Error in discussion mode: {e}")
+            logger.error("Error in discussion mode: %s", e)
             await message.answer(t(lang, "error_llm"))
 
     async def _handle_done(self, message: types.Message):
         """Process accumulated text when user sends /done."""
         user_id = message.from_user.id
-        lang = self.user_langs.get(user_id, DEFAULT_LANG)
-        state = self.user_states.get(user_id, "chat")
-        full_text = self.accumulated_text.get(user_id, "")
+        lang = self._lang_of(user_id)
+        state = self.users[user_id].state
+        full_text = self.users[user_id].accumulated_text or ""
         
         # If in discussion mode, /done exits to normal chat
         if state in self.DISCUSSION_STATES:
-            self.user_states[user_id] = "chat"
-            if user_id in self.accumulated_text:
-                del self.accumulated_text[user_id]
+            self.users[user_id].state = "chat"
+            self.users[user_id].accumulated_text = None
             await message.answer(t(lang, "discuss_exit"), reply_markup=get_main_keyboard(lang))
             return
         
@@ -1904,8 +1945,8 @@ class TelegramWriterBot:
             chars = count_chars(full_text)
             add_word_count(user_id, words, chars)
             s = get_stats(user_id)
-            self.user_states[user_id] = "chat"
-            del self.accumulated_text[user_id]
+            self.users[user_id].state = "chat"
+            self.users[user_id].accumulated_text = None
             await message.answer(t(lang, "count_me_done", count=words, chars=chars, today=s["today"], week=s["week"], month=s["month"], total=s["total"], chars_today=s["chars_today"], chars_week=s["chars_week"], chars_month=s["chars_month"], chars_total=s["chars_total"]))
             return
         
@@ -1916,19 +1957,12 @@ class TelegramWriterBot:
                 return
             
             # Show buttons for format choice
-            builder = ReplyKeyboardBuilder()
-            builder.add(KeyboardButton(text=t(lang, "btn_summary_sentence")))
-            builder.add(KeyboardButton(text=t(lang, "btn_summary_paragraph")))
-            builder.add(KeyboardButton(text=t(lang, "btn_summary_two_paragraphs")))
-            builder.add(KeyboardButton(text=t(lang, "btn_summary_detailed")))
-            builder.adjust(1)
-            
             await message.answer(
                 t(lang, "summary_choose_format"),
-                reply_markup=builder.as_markup(resize_keyboard=True)
+                reply_markup=get_summary_keyboard(lang, 1)
             )
             # Move to explicit format selection state
-            self.user_states[user_id] = self.SUMMARY_FORMAT_STATE
+            self.users[user_id].state = self.SUMMARY_FORMAT_STATE
             return
 
 
@@ -1937,24 +1971,24 @@ class TelegramWriterBot:
             if not full_text:
                 await message.answer(t(lang, "no_text_accumulated"))
                 return
-            if ADMIN_ID <= 0:
+            if self.admin_id <= 0:
                 await message.answer(
                     "Dev feedback is not configured (ADMIN_ID is missing in .env)."
                     if lang == "en" else
                     "dev_feedback не настроен: в .env не задан ADMIN_ID (ID разработчика)."
                 )
-                self.user_states[user_id] = "chat"
-                del self.accumulated_text[user_id]
+                self.users[user_id].state = "chat"
+                self.users[user_id].accumulated_text = None
                 return
             try:
                 user_info = f"@{message.from_user.username}" if message.from_user.username else f"ID:{user_id}"
                 dev_msg = f"Dev feedback from {user_info}:\n\n{full_text}"
-                await self.bot.send_message(chat_id=ADMIN_ID, text=dev_msg)
+                await self.bot.send_message(chat_id=self.admin_id, text=dev_msg)
                 await message.answer(t(lang, "dev_feedback_thanks"))
             except Exception:
                 await message.answer(t(lang, "error_llm"))
-            self.user_states[user_id] = "chat"
-            del self.accumulated_text[user_id]
+            self.users[user_id].state = "chat"
+            self.users[user_id].accumulated_text = None
             return
 
         
@@ -1967,36 +2001,32 @@ class TelegramWriterBot:
 
         # Validate text
         if not full_text or len(full_text.strip()) < min_len:
-            await message.answer(t(lang, "text_too_short", min=min_len))
+            await message.answer(_t(lang, "text_too_short", min=min_len))
             return
 
         if handler_method is None:
             await message.answer(t(lang, "error_llm"))
             return
 
-        wb = self._get_writer_bot(user_id)
-        handler = getattr(wb, handler_method, None)
-        if handler is None:
+        if not hasattr(self._get_writer_bot(user_id), handler_method):
             await message.answer(t(lang, "error_llm"))
             return
 
         # Process with LLM
 
-        await self.bot.send_chat_action(chat_id=message.chat.id, action="typing")
         try:
-            reply = handler(full_text)
+            reply = await self._run_cached(message.chat.id, user_id, handler_method, full_text)
             # Transition to discussion mode for sticky tools
             discuss_state = f"{state}_discuss"
             if discuss_state in self.DISCUSSION_STATES:
-                self.user_states[user_id] = discuss_state
+                self.users[user_id].state = discuss_state
                 # Keep accumulated_text for context in discussion
-                self.accumulated_text[user_id] = full_text
+                self.users[user_id].accumulated_text = full_text
                 await message.answer(reply + f"\n\n{t(lang, 'discuss_mode_hint')}")
             else:
-                self.user_states[user_id] = "chat"
+                self.users[user_id].state = "chat"
                 # Clear accumulated text after normal processing
-                if user_id in self.accumulated_text:
-                    del self.accumulated_text[user_id]
+                self.users[user_id].accumulated_text = None
                 await message.answer(reply)
             return
 
@@ -2013,35 +2043,40 @@ class TelegramWriterBot:
             
             if not hasattr(self, 'group_chats'):
                 continue
-                
-            for chat_id in list(getattr(self, 'group_chats', [])):
-                last_time = getattr(self, 'last_porko_lobster', {}).get(chat_id)
-                if last_time and (datetime.now() - last_time).total_seconds() < 4 * 3600:
-                    continue
-                
-                try:
-                    if random.random() < 0.75:
-                        wb = self._get_writer_bot(0)
-                        reply = wb.porko()
-                        await self.bot.send_message(chat_id=chat_id, text=reply)
-                    else:
-                        await self.bot.send_chat_action(chat_id=chat_id, action="typing")
-                        wb = self._get_writer_bot(0)
-                        chunks = wb.lobster()
-                        if chunks:
-                            for chunk in chunks:
-                                if chunk and chunk.strip():
-                                    await self.bot.send_message(chat_id=chat_id, text=chunk)
-                                    await asyncio.sleep(0.8)
-                        else:
-                            await self.bot.send_message(chat_id=chat_id, text="хрю")
-                    
-                    if not hasattr(self, 'last_porko_lobster'):
-                        self.last_porko_lobster = {}
-                    self.last_porko_lobster[chat_id] = datetime.now()
-                except Exception as e:
-                    print(f"Auto porko/lobster error: {e}")
+            
+            # All chats at once, each after its own random delay so the sends don't arrive in one burst
+            await asyncio.gather(
+                *(self._send_porko_or_lobster(chat_id) for chat_id in list(self.group_chats)),
+                return_exceptions=True,
+            )
 
+    async def _send_porko_or_lobster(self, chat_id: int):
+        """Send one auto porko/lobster to a group chat, unless it got one in the last 4 hours."""
+        last_time = getattr(self, 'last_porko_lobster', {}).get(chat_id)
+        if last_time and time.monotonic() - last_time < 4 * 3600:
+            return
+        
+        await asyncio.sleep(random.uniform(0, self.AUTO_POST_JITTER_SECONDS))
+        try:
+            # porko/lobster don't touch history, so chats don't wait on each other for session 0
+            wb = self._get_writer_bot(0)
+            if random.random() < 0.75:
+                reply = await self._run_wb(None, wb.porko)
+                await self.broadcast_limiter.wait()
+                await self.bot.send_message(chat_id=chat_id, text=reply)
+            else:
+                chunks = await self._run_with_typing(chat_id, None, wb.lobster)
+                await self.broadcast_limiter.wait()
+                if chunks:
+                    await self._send_chunks_delayed(chat_id, chunks)
+                else:
+                    await self.bot.send_message(chat_id=chat_id, text="хрю")
+            
+            if not hasattr(self, 'last_porko_lobster'):
+                self.last_porko_lobster = {}
+            self.last_porko_lobster[chat_id] = time.monotonic()
+        except Exception as e:
+            logger.error("Auto porko/lobster error: %s", e)
 
 async def main():
     import argparse
@@ -2052,7 +2087,7 @@ async def main():
 
     token = os.getenv("TELEGRAM_BOT_TOKEN")
     if not token:
-        print("Error: TELEGRAM_BOT_TOKEN not set")
+        logger.error("TELEGRAM_BOT_TOKEN not set")
         return
 
     bot = TelegramWriterBot(
@@ -5,6 +5,7 @@ Writer's Tears — bot for writers: creative block, ideas, exercises, feedback.
 import os
 import json
 import random
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, Generator
 from dataclasses import dataclass
@@ -15,6 +16,36 @@ from lang_utils import detect_language
 
 load_dotenv()
 
+PROMPTS_DIR = Path(__file__).parent.parent / "prompts"
+
+
+@lru_cache(maxsize=8)
+def _read_system_prompt(language: str) -> Optional[str]:
+    """System prompt file contents for a language (read from disk once per language), or None."""
+    for path in (PROMPTS_DIR / f"system_prompt.{language}.md", PROMPTS_DIR / "system_prompt.md"):
+        if path.exists():
+            return path.read_text(encoding="utf-8")
+    return None
+
+
+# Heavy, read-only parts are shared by all sessions (one WriterBot per user)
+@lru_cache(maxsize=None)
+def _get_shared_rag(data_dir: Optional[str]):
+    """One WriterRAG (chunks + embeddings) per data dir."""
+    from writer_rag import WriterRAG
+    return WriterRAG(data_dir=data_dir)
+
+
+@lru_cache(maxsize=None)
+def _get_shared_client(api_key: Optional[str], api_base: Optional[str]):
+    """One OpenAI client (and connection pool) per API key + base URL."""
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, base_url=api_base)
+
+
+# Writing prompts data per language, loaded on first use
+_PROMPTS_DATA: dict[str, dict] = {}
+
 
 @dataclass
 class Message:
@@ -56,14 +87,8 @@ class WriterBot:
         self._prompts_data: Optional[dict] = None
 
     def _load_system_prompt(self) -> str:
-        prompts_dir = Path(__file__).parent.parent / "prompts"
-        lang_file = prompts_dir / f"system_prompt.{self.language}.md"
-        if lang_file.exists():
-            return lang_file.read_text(encoding="utf-8")
-        generic = prompts_dir / "system_prompt.md"
-        if generic.exists():
-            return generic.read_text(encoding="utf-8")
-        return self._default_prompt()
+        prompt = _read_system_prompt(self.language)
+        return prompt if prompt is not None else self._default_prompt()
 
     def _default_prompt(self) -> str:
         return """You are Writer's Tears — a writer with twenty years of experience. You help with creative block, plot and character development, dialogue, and style. You draw on craft advice from authors like Stephen King, Anne Lamott, Ray Bradbury, John Truby, Robert McKee. Be concise, concrete, and direct. No fluff, no empty motivation."""
@@ -97,8 +122,7 @@ class WriterBot:
 
     def _init_rag(self, data_dir: Optional[str]):
         try:
-            from writer_rag import WriterRAG
-            self.rag = WriterRAG(data_dir=data_dir)
+            self.rag = _get_shared_rag(data_dir)
             print("Writer RAG initialized")
         except Exception as e:
             print(f"Writer RAG unavailable: {e}")
@@ -106,21 +130,23 @@ class WriterBot:
 
     def _init_llm(self):
         try:
-            from openai import OpenAI
-            self.client = OpenAI(api_key=self.api_key, base_url=self.api_base)
+            self.client = _get_shared_client(self.api_key, self.api_base)
             print(f"LLM client initialized: {self.model}")
         except ImportError:
             print("openai not installed. pip install openai")
             self.client = None
 
     def _clear_prompts_cache(self) -> None:
-        """Clear the prompts data cache to force reload on next access."""
+        """Drop this session's prompts data so the next access picks the current language's."""
         self._prompts_data = None
         print(f"[PROMPTS] Cache cleared for language '{self.language}'")
 
     def _load_prompts_data(self) -> dict:
         if self._prompts_data is not None:
             return self._prompts_data
+        if self.language in _PROMPTS_DATA:
+            self._prompts_data = _PROMPTS_DATA[self.language]
+            return self._prompts_data
         
         # Try language-specific file first
         lang_suffix = f".{self.language}" if self.language != "en" else ""
@@ -159,6 +185,7 @@ class WriterBot:
             print(f"[PROMPTS] Falling back to default prompts data")
             self._prompts_data = self._default_prompts_data()
         
+        _PROMPTS_DATA[self.language] = self._prompts_data
         return self._prompts_data
 
     def _default_prompts_data(self) -> dict: